@@ -2,333 +2,877 @@ import dash
 from dash import dcc, html, dash_table
 import dash_bootstrap_components as dbc
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import re
 from datetime import datetime
+from functools import lru_cache
+import hashlib
+import os
+import sys
+import tempfile
 
-# Initialize the Dash app
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# Shared modules live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from transaction_cache import (CATEGORICAL_COLUMNS, convert_columns, guess_date_formats, load_transactions,
+                               restore_source_text)
+from result_store import load_or_compute_results, result_store_path
+from parallel_backend import map_partitions, resolve_workers, row_ranges
+from background_loader import BackgroundLoader
+from instrumentation import record_frame_memory, timed_stage
+from dashboard_diagnostics import diagnostics_components, register_diagnostics
 
 # Read CSV file (changed from Excel to CSV based on your file path)
-csv_file_path = r"C:\Users\aakas\Downloads\projects\Business_analytical project\Project-4\Data\online_retail_final.csv"  # Change this to your file path
-df = pd.read_csv(csv_file_path)
+# (set RETAIL_CSV_PATH to point the dashboard at another file, e.g. a synthetic benchmark file)
+csv_file_path = os.environ.get('RETAIL_CSV_PATH', r"C:\Users\aakas\Downloads\projects\Business_analytical project\Project-4\Data\online_retail_final.csv")  # Change this to your file path
 
-# Data quality checks function for retail data
-def run_data_quality_checks(df):
-    # Make a copy to avoid SettingWithCopyWarning
-    df = df.copy()
-    
-    # 1. Invoice Date validation
-    df['invoice_date_valid'] = pd.to_datetime(df['InvoiceDate'], errors='coerce').notna()
-    
-    # 2. Customer ID validation (should be numeric)
-    df['customer_id_valid'] = pd.to_numeric(df['CustomerID'], errors='coerce').notna()
-    
-    # 3. Quantity validation (should be positive)
-    df['quantity_valid'] = (df['Quantity'] > 0)
+## Declarative data quality rules
+# One rule per check, in bit order. 'valid_when' is a pandas expression every valid row satisfies
+# (missing results count as failures) over the columns, QUALITY_DERIVED_COLUMNS and
+# QUALITY_RULE_PARAMETERS; 'field' is the expression shown as the failing value in the issue table.
+QUALITY_RULES = [
+    {'name': 'invoice_date_valid', 'metric': 'date_issues', 'issue_type': 'Date Format', 'severity': 'Normal',
+     'message': 'Invalid date format', 'valid_when': "invoice_date.notna()", 'field': "InvoiceDate"},
+    {'name': 'customer_id_valid', 'metric': 'customer_id_issues', 'issue_type': 'Customer ID', 'severity': 'Normal',
+     'message': 'Invalid customer ID', 'valid_when': "to_numeric(CustomerID, errors='coerce').notna()",
+     'field': "CustomerID"},
+    {'name': 'quantity_valid', 'metric': 'quantity_issues', 'issue_type': 'Quantity', 'severity': 'Critical',
+     'message': 'Invalid quantity (not positive)', 'valid_when': "Quantity > 0", 'field': "Quantity"},
+    {'name': 'unit_price_valid', 'metric': 'unit_price_issues', 'issue_type': 'Unit Price', 'severity': 'Critical',
+     'message': 'Invalid unit price (not positive)', 'valid_when': "UnitPrice > 0", 'field': "UnitPrice"},
+    {'name': 'description_valid', 'metric': 'description_issues', 'issue_type': 'Description', 'severity': 'Normal',
+     'message': 'Missing or empty description',
+     'valid_when': "Description.notna() & (Description.str.strip() != '')", 'field': "Description"},
+    {'name': 'total_price_valid', 'metric': 'total_price_issues', 'issue_type': 'Total Price', 'severity': 'Critical',
+     'message': "Total doesn't match quantity × unit price",
+     'valid_when': "abs(TotalPrice - calculated_total) < total_price_tolerance",
+     'field': "'Actual: ' + TotalPrice.astype(str) + ', Calculated: ' + calculated_total.astype(str)"},
+    {'name': 'unique_line', 'metric': 'duplicate_line_issues', 'issue_type': 'Duplicate Line', 'severity': 'Normal',
+     'message': 'Repeats an earlier identical invoice line', 'valid_when': "~duplicate_line", 'field': "Quantity"},
+    {'name': 'past_date', 'metric': 'future_date_issues', 'issue_type': 'Future Date', 'severity': 'Normal',
+     'message': 'Invoice date is in the future', 'valid_when': "~(invoice_date > now)", 'field': "InvoiceDate"},
+    {'name': 'typical_price', 'metric': 'outlier_price_issues', 'issue_type': 'Outlier Price', 'severity': 'Critical',
+     'message': 'Unit price far above the usual price of the stock code',
+     'valid_when': "~(UnitPrice > outlier_price_factor * stock_code_median_price)", 'field': "UnitPrice"},
+    {'name': 'not_cancelled', 'metric': 'cancelled_invoice_issues', 'issue_type': 'Cancelled Invoice',
+     'severity': 'Normal', 'message': "Cancellation invoice ('C' prefix)",
+     'valid_when': "~text(InvoiceNo).str.startswith('C')", 'field': "InvoiceNo"},
+    {'name': 'stock_code_format', 'metric': 'stock_code_issues', 'issue_type': 'Stock Code', 'severity': 'Normal',
+     'message': 'Stock code is not a product code (5 digits and an optional suffix)',
+     'valid_when': "text(StockCode).str.fullmatch(stock_code_pattern)", 'field': "StockCode"},
+]
+
+# Severities in display order with their chart colors
+SEVERITY_COLORS = {'Critical': '#ff7f0e', 'Normal': '#1f77b4'}
+
+# Constants the rule expressions can use
+QUALITY_RULE_PARAMETERS = {
+    'total_price_tolerance': 0.01,  # Allow small rounding differences
+    'outlier_price_factor': 10,
+    'stock_code_pattern': r'\d{5}[A-Za-z]{0,2}',
+}
+
+# Intermediate columns shared by several rules, computed per block on first use
+QUALITY_DERIVED_COLUMNS = {
+    'calculated_total': "Quantity * UnitPrice",
+}
+
+# Intermediate columns that need the whole frame (rows are compared with each other, and dates must be
+# parsed with one inferred format), computed once before the blocks are evaluated. In parallel mode they
+# are computed before the frame is split; when streaming, duplicated_rows and group_median keep state
+# across chunks so the results equal those of the whole frame. Lines are compared including the source
+# text of dates and IDs that could not be converted, so e.g. two different invalid dates do not match.
+QUALITY_FRAME_COLUMNS = {
+    'invoice_date': "to_datetime(InvoiceDate, errors='coerce')",
+    'duplicate_line': "duplicated_rows(InvoiceNo, StockCode, Description, Quantity, InvoiceDate, UnitPrice, CustomerID, "
+                      "InvoiceDate_source, CustomerID_source)",
+    'stock_code_median_price': "group_median(UnitPrice, StockCode)",
+}
+
+# Rows per block of the fused evaluation; every intermediate mask is at most this long
+QUALITY_BLOCK_ROWS = 1 << 16
+
+# Rows repeating an earlier row in all of the given columns. Categorical columns are compared by
+# their codes; rows are hashed first and only rows sharing a hash with another row are compared exactly.
+def duplicated_rows(*columns):
+    frame = pd.DataFrame({i: column.cat.codes if isinstance(column.dtype, pd.CategoricalDtype) else column
+                          for i, column in enumerate(columns)})
+    candidates = pd.util.hash_pandas_object(frame, index=False).duplicated(keep=False).to_numpy()
+    duplicated = np.zeros(len(frame), dtype=bool)
+    duplicated[candidates] = frame.loc[candidates].duplicated().to_numpy()
+    return pd.Series(duplicated, index=frame.index)
+
+# Median of the values per key, broadcast to every row (missing where the key or all its values are missing)
+def group_median(values, keys):
+    return values.groupby(keys, observed=True, sort=False).transform('median')
+
+# The column as text for the .str methods; string and string-categorical columns are used as they are
+def text(column):
+    dtype = column.dtype.categories.dtype if isinstance(column.dtype, pd.CategoricalDtype) else column.dtype
+    return column if pd.api.types.is_string_dtype(dtype) else column.astype(str)
+
+# Functions the rule expressions can call (no other builtins are available to them)
+QUALITY_RULE_FUNCTIONS = {'to_datetime': pd.to_datetime, 'to_numeric': pd.to_numeric, 'abs': abs, 'str': str,
+                          'text': text, 'duplicated_rows': duplicated_rows, 'group_median': group_median}
+
+# Derived from the registry: (rule name, metric key) in bit order, bit per rule and the narrowest flags dtype.
+# Bit i of the packed 'quality_flags' column is set when rule i failed.
+QUALITY_CHECKS = [(rule['name'], rule['metric']) for rule in QUALITY_RULES]
+QUALITY_FLAG_BITS = {rule['name']: bit for bit, rule in enumerate(QUALITY_RULES)}
+QUALITY_FLAGS_DTYPE = np.min_scalar_type(1 << (len(QUALITY_RULES) - 1))
+QUALITY_FLAGS_COLUMN = 'quality_flags'
+
+# Short hash of the rules, so stored results are recomputed when the rules change
+QUALITY_RULES_VERSION = hashlib.blake2b(repr((QUALITY_RULES, QUALITY_RULE_PARAMETERS, QUALITY_DERIVED_COLUMNS,
+                                              QUALITY_FRAME_COLUMNS)).encode(), digest_size=4).hexdigest()
+
+# Compile every expression once and record the names it reads
+def compile_expression(expression, label):
+    code = compile(expression, f"<quality rule {label}>", 'eval')
+    return code, set(code.co_names)
+
+COMPILED_DERIVED_COLUMNS = {name: compile_expression(expr, name)[0] for name, expr in QUALITY_DERIVED_COLUMNS.items()}
+COMPILED_FRAME_COLUMNS = {name: compile_expression(expr, name)[0] for name, expr in QUALITY_FRAME_COLUMNS.items()}
+COMPILED_QUALITY_RULES = [
+    (QUALITY_FLAG_BITS[rule['name']], *compile_expression(rule['valid_when'], rule['name']))
+    for rule in QUALITY_RULES
+]
+COMPILED_ISSUE_FIELDS = {rule['name']: compile_expression(rule['field'], rule['name'] + ' field')[0]
+                         for rule in QUALITY_RULES}
+
+for rule in QUALITY_RULES:
+    if compile_expression(rule['field'], rule['name'])[1] & set(QUALITY_FRAME_COLUMNS):
+        raise ValueError(f"Issue field of {rule['name']} cannot use whole-frame columns")
+
+# Names visible to rule expressions: the frame's columns (or one block of rows of them), the derived
+# columns, computed on first use and kept for the other rules, and the shared parameters and functions
+# (some of which streaming replaces with stateful versions)
+class RuleNamespace(dict):
+    def __init__(self, df, rows=slice(None), frame_namespace=None, now=None, functions=None):
+        super().__init__(QUALITY_RULE_PARAMETERS, **QUALITY_RULE_FUNCTIONS, now=now)
+        self.update(functions or {})
+        self.df = df
+        self.rows = rows
+        self.frame_namespace = frame_namespace
     
-    # 4. Unit Price validation (should be positive)
-    df['unit_price_valid'] = (df['UnitPrice'] > 0)
+    def __missing__(self, name):
+        if name in COMPILED_DERIVED_COLUMNS:
+            value = evaluate_expression(COMPILED_DERIVED_COLUMNS[name], self)
+        elif name in COMPILED_FRAME_COLUMNS:
+            if self.frame_namespace is None:
+                value = evaluate_expression(COMPILED_FRAME_COLUMNS[name], self)
+            else:
+                value = self.frame_namespace[name].iloc[self.rows]
+        elif name in self.df.columns:
+            value = self.df[name].iloc[self.rows]
+        else:
+            raise NameError(f"Unknown name in quality rule: {name}")
+        self[name] = value
+        return value
+
+def evaluate_expression(code, namespace):
+    return eval(code, {'__builtins__': {}}, namespace)
+
+# Boolean validity array of an expression result; missing results count as invalid
+def valid_array(result):
+    return result.to_numpy(dtype=bool, na_value=False) if hasattr(result, 'to_numpy') else np.asarray(result, dtype=bool)
+
+# The categorical column a rule reads, if it reads no other column: such rules are evaluated
+# once per category (plus missing) and broadcast through the codes
+def single_categorical_column(df, names):
+    columns = [name for name in names if name in df.columns or name in QUALITY_DERIVED_COLUMNS
+               or name in QUALITY_FRAME_COLUMNS]
+    if len(columns) == 1 and columns[0] in df.columns and isinstance(df[columns[0]].dtype, pd.CategoricalDtype):
+        return columns[0]
+    return None
+
+# The whole-frame columns of a frame, all computed at once
+def compute_frame_columns(df):
+    namespace = RuleNamespace(df)
+    return {name: namespace[name] for name in COMPILED_FRAME_COLUMNS}
+
+# Evaluate every rule in one fused pass over blocks of rows and pack the failures into one bitmask per row.
+# frame_columns holds whole-frame columns computed elsewhere (for a partition or a streamed chunk).
+@timed_stage('evaluate_quality_rules')
+def evaluate_quality_rules(df, block_rows=QUALITY_BLOCK_ROWS, frame_columns=None):
+    flags = np.zeros(len(df), dtype=QUALITY_FLAGS_DTYPE)
+    frame_namespace = RuleNamespace(df, now=pd.Timestamp.now())
+    frame_namespace.update(frame_columns or {})
     
-    # 5. Description validation (should not be empty)
-    df['description_valid'] = (~df['Description'].isna()) & (df['Description'].str.strip() != '')
+    row_rules = []
+    for bit, code, names in COMPILED_QUALITY_RULES:
+        column = single_categorical_column(df, names)
+        if column is None:
+            row_rules.append((bit, code))
+            continue
+        categories = df[column].cat.categories
+        # The categories as a plain column (their .str methods are vectorized), plus a missing value
+        values = pd.DataFrame({column: pd.Series(categories).reindex(np.arange(len(categories) + 1))})
+        category_valid = valid_array(evaluate_expression(code, RuleNamespace(values, now=frame_namespace['now'])))
+        # Code -1 (missing) picks the last entry
+        flags |= (~category_valid[df[column].cat.codes.to_numpy()]).astype(QUALITY_FLAGS_DTYPE) << bit
     
-    # 6. Total Price validation (should match Quantity * UnitPrice)
-    df['calculated_total'] = df['Quantity'] * df['UnitPrice']
-    df['total_price_valid'] = (abs(df['TotalPrice'] - df['calculated_total']) < 0.01)  # Allow small rounding differences
+    for start in range(0, len(df), block_rows):
+        rows = slice(start, min(start + block_rows, len(df)))
+        namespace = RuleNamespace(df, rows, frame_namespace, now=frame_namespace['now'])
+        for bit, code in row_rules:
+            flags[rows] |= (~valid_array(evaluate_expression(code, namespace))).astype(QUALITY_FLAGS_DTYPE) << bit
     
+    return flags
+
+# Data quality checks function for retail data: adds the packed flags of every rule
+@timed_stage('run_data_quality_checks')
+def run_data_quality_checks(df, frame_columns=None):
+    # A shallow copy adds the flags column without copying (or modifying) the source columns
+    df = df.copy(deep=False)
+    df[QUALITY_FLAGS_COLUMN] = evaluate_quality_rules(df, frame_columns=frame_columns)
     return df
 
+# Rows that failed one check, as a boolean array
+def check_failed(df, check):
+    return (df[QUALITY_FLAGS_COLUMN].to_numpy() >> QUALITY_FLAG_BITS[check]) & 1 == 1
+
+# Count records and failed checks; counts from several chunks can simply be added up
+@timed_stage('count_quality_issues')
+def count_quality_issues(df):
+    flags = df[QUALITY_FLAGS_COLUMN].to_numpy()
+    counts = {'total_records': len(df)}
+    for name, metric in QUALITY_CHECKS:
+        counts[metric] = int(np.count_nonzero(flags & (1 << QUALITY_FLAG_BITS[name])))
+    return counts
+
 # Calculate data quality metrics for retail data
 def calculate_quality_metrics(df):
-    metrics = {
-        'total_records': len(df),
-        'date_issues': (~df['invoice_date_valid']).sum(),
-        'customer_id_issues': (~df['customer_id_valid']).sum(),
-        'quantity_issues': (~df['quantity_valid']).sum(),
-        'unit_price_issues': (~df['unit_price_valid']).sum(),
-        'description_issues': (~df['description_valid']).sum(),
-        'total_price_issues': (~df['total_price_valid']).sum(),
-    }
-    
-    # Define critical issues (pricing and quantity related)
-    metrics['critical_issues'] = metrics['quantity_issues'] + metrics['unit_price_issues'] + metrics['total_price_issues']
+    return summarize_quality_metrics(count_quality_issues(df))
+
+# Derive severity totals ('critical_issues', 'normal_issues') and the quality score from the per-check counts
+def summarize_quality_metrics(counts):
+    metrics = dict(counts)
     
-    # Define normal issues (descriptive and customer info)
-    metrics['normal_issues'] = metrics['date_issues'] + metrics['customer_id_issues'] + metrics['description_issues']
+    for severity in SEVERITY_COLORS:
+        metrics[f'{severity.lower()}_issues'] = sum(
+            metrics[rule['metric']] for rule in QUALITY_RULES if rule['severity'] == severity)
     
-    total_issues = metrics['critical_issues'] + metrics['normal_issues']
+    total_issues = sum(metrics[f'{severity.lower()}_issues'] for severity in SEVERITY_COLORS)
     
     metrics['quality_score'] = 100 - (total_issues / metrics['total_records'] * 100) if metrics['total_records'] > 0 else 100
     
     return metrics
 
-# Run quality checks and calculate metrics
-df = run_data_quality_checks(df)
-metrics = calculate_quality_metrics(df)
+ISSUE_TABLE_COLUMNS = ['invoice_no', 'stock_code', 'issue_type', 'field_value', 'description', 'severity']
 
-# Generate dashboard layout
-app.layout = dbc.Container([
-    html.H1("Retail Data Quality Dashboard", className="mb-4 text-center"),
+# Build a long-format issue frame (one row per failed check) from the flags and the rules' field expressions.
+# Field values show the file's original text where the typed cache could not convert a date or ID.
+@timed_stage('build_issue_frame')
+def build_issue_frame(df):
+    frames = []
+    for rule in QUALITY_RULES:
+        failing = df.loc[check_failed(df, rule['name'])]
+        field_value = evaluate_expression(COMPILED_ISSUE_FIELDS[rule['name']],
+                                          RuleNamespace(restore_source_text(failing)))
+        frames.append(pd.DataFrame({
+            'row_index': failing.index,
+            'invoice_no': failing['InvoiceNo'].to_numpy(),
+            'stock_code': failing['StockCode'].to_numpy(),
+            'issue_type': rule['issue_type'],
+            'field_value': field_value.to_numpy(dtype=object),
+            'description': rule['message'],
+            'severity': rule['severity'],
+        }))
     
-    # Summary Cards
-    dbc.Row([
-        dbc.Col(dbc.Card([
-            dbc.CardHeader("Total Records"),
-            dbc.CardBody([
-                html.H4(f"{metrics['total_records']:,}", className="card-title")
-            ])
-        ], color="light", outline=True), md=3),
+    issue_frame = pd.concat(frames, ignore_index=True)
+    
+    # Repeated labels are stored once as categories instead of once per row
+    issue_frame['issue_type'] = pd.Categorical(
+        issue_frame['issue_type'], categories=[rule['issue_type'] for rule in QUALITY_RULES])
+    issue_frame['description'] = pd.Categorical(
+        issue_frame['description'], categories=[rule['message'] for rule in QUALITY_RULES])
+    issue_frame['severity'] = pd.Categorical(issue_frame['severity'], categories=list(SEVERITY_COLORS))
+    
+    return issue_frame
+
+# Convert the issue frame to DataTable records in a single pass
+@timed_stage('issue_frame_to_records')
+def issue_frame_to_records(issue_frame):
+    return issue_frame[ISSUE_TABLE_COLUMNS].to_dict('records')
+
+## Streaming mode for files larger than RAM
+# Rows per chunk when streaming; None reads the whole file at once
+STREAMING_CHUNKSIZE = None
+
+# Failing rows kept per issue type for the table when streaming
+STREAMING_SAMPLE_PER_ISSUE = 10000
+
+# Bytes of row hashes (8 per row) the duplicate check keeps in memory when streaming; beyond that they
+# are moved to memory-mapped temporary files, so memory stays bounded and disk use grows with the rows
+STREAMING_HASH_MEMORY = 256 * 2 ** 20
+
+# Chunks of the CSV (optionally only some of its columns), each converted like the typed cache so the
+# rules see the same values (and source text) in every mode. Dates are parsed with the format of the
+# file's first date, as the cache parses the whole column, not with one inferred per chunk.
+def read_csv_chunks(csv_file_path, chunksize, columns=None):
+    date_formats = {}
+    for chunk in pd.read_csv(csv_file_path, chunksize=chunksize, dtype={col: str for col in CATEGORICAL_COLUMNS},
+                             usecols=None if columns is None else lambda column: column in columns):
+        date_formats = {**guess_date_formats(chunk), **date_formats}
+        yield convert_columns(chunk, date_formats)
+
+# Per-row hashes of the given columns, equal for equal values in every chunk: numbers are hashed as
+# float64 (a chunk's integers may be downcast or read as floats), dates at one resolution, categoricals
+# by their category values and everything else as text.
+def row_hashes(columns):
+    frame = pd.DataFrame({i: hashable_column(column) for i, column in enumerate(columns)})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+def hashable_column(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column
+    if pd.api.types.is_numeric_dtype(column):
+        return column.astype('float64')
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.astype('datetime64[ns]')
+    return column.astype(str)
+
+# Sorted distinct values (a plain sort is much faster than np.unique's hashing for 64-bit hashes)
+def sorted_unique(values):
+    values = np.sort(values)
+    distinct = np.ones(len(values), dtype=bool)
+    distinct[1:] = values[1:] != values[:-1]
+    return values[distinct]
+
+# duplicated_rows across the chunks of a streamed file: the 64-bit hashes of the rows seen so far are
+# kept as a few sorted runs (merged as they grow, so a lookup searches O(log chunks) runs). Without the
+# rows themselves, a false match needs a hash collision. Once the runs in memory exceed
+# STREAMING_HASH_MEMORY they are merged into one file that is mapped read-only, so the operating
+# system keeps only the pages the lookups use.
+class StreamingRowSet:
+    def __init__(self):
+        self.runs = []
+        self.spilled_runs = []
+        self.spill_dir = None
+        self.memory_limit = STREAMING_HASH_MEMORY
+    
+    def duplicated(self, *columns):
+        hashes = row_hashes(columns)
+        duplicated = pd.Series(hashes).duplicated().to_numpy(copy=True)
+        
+        # Sorted lookups read the mapped runs front to back instead of at random
+        order = np.argsort(hashes, kind='stable')
+        sorted_hashes = hashes[order]
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.spilled_runs + self.runs:
+            positions = np.minimum(np.searchsorted(run, sorted_hashes), len(run) - 1)
+            found |= run[positions] == sorted_hashes
+        duplicated[order] |= found
         
-        dbc.Col(dbc.Card([
-            dbc.CardHeader("Data Quality Score"),
-            dbc.CardBody([
-                html.H4(f"{metrics['quality_score']:.1f}%", className="card-title"),
+        self.runs.append(sorted_unique(hashes))
+        while len(self.runs) > 1 and len(self.runs[-1]) >= len(self.runs[-2]):
+            self.runs.append(sorted_unique(np.concatenate([self.runs.pop(), self.runs.pop()])))
+        if sum(run.nbytes for run in self.runs) > self.memory_limit:
+            self.spill()
+        return pd.Series(duplicated, index=columns[0].index)
+    
+    # Move the runs in memory to one sorted temporary file (removed with the set) and map it
+    def spill(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.TemporaryDirectory(prefix='quality-hashes-', ignore_cleanup_errors=True)
+        path = os.path.join(self.spill_dir.name, f"run{len(self.spilled_runs)}.npy")
+        np.save(path, sorted_unique(np.concatenate(self.runs)))
+        self.spilled_runs.append(np.load(path, mmap_mode='r'))
+        self.runs = []
+
+# group_median across the chunks of a streamed file. A first pass adds up how often each (key, value)
+# pair occurs; the exact medians per key follow from those counts, which are far fewer than the rows.
+class StreamingGroupMedians:
+    def __init__(self):
+        self.counts = None
+        self.medians = None
+    
+    def add(self, values, keys):
+        counts = values.groupby([keys, values], observed=True).size()
+        self.counts = counts if self.counts is None else self.counts.add(counts, fill_value=0)
+        return values
+    
+    def finish(self):
+        if self.counts is None:
+            self.medians = pd.Series(dtype='float64')
+            return
+        frame = self.counts.sort_index().rename_axis(['key', 'value']).rename('count').reset_index()
+        position = frame.groupby('key', sort=False)['count'].cumsum()
+        total = frame.groupby('key', sort=False)['count'].transform('sum')
+        # The middle value, or the mean of the two middle values for an even count
+        lower = frame[position > (total - 1) // 2].groupby('key', sort=False)['value'].first()
+        upper = frame[position > total // 2].groupby('key', sort=False)['value'].first()
+        self.medians = (lower + upper) / 2
+    
+    def __call__(self, values, keys):
+        return keys.map(self.medians).astype('float64')
+
+# Stateful cross-row functions for each whole-frame column of a streamed file. Medians need every
+# chunk, so the columns using group_median read the file once beforehand to collect the counts.
+def streaming_frame_functions(csv_file_path, chunksize):
+    functions = {name: {'duplicated_rows': StreamingRowSet().duplicated, 'group_median': StreamingGroupMedians()}
+                 for name in COMPILED_FRAME_COLUMNS}
+    median_columns = [name for name, code in COMPILED_FRAME_COLUMNS.items() if 'group_median' in code.co_names]
+    if median_columns:
+        # The first pass reads only the columns these expressions use
+        names = set().union(*(COMPILED_FRAME_COLUMNS[name].co_names for name in median_columns))
+        for chunk in read_csv_chunks(csv_file_path, chunksize, names):
+            for name in median_columns:
+                evaluate_expression(COMPILED_FRAME_COLUMNS[name],
+                                    RuleNamespace(chunk, functions={'group_median': functions[name]['group_median'].add}))
+        for name in median_columns:
+            functions[name]['group_median'].finish()
+    return functions
+
+# The whole-frame columns of one streamed chunk
+def streaming_frame_columns(chunk, functions):
+    return {name: evaluate_expression(code, RuleNamespace(chunk, functions=functions[name]))
+            for name, code in COMPILED_FRAME_COLUMNS.items()}
+
+# Run the checks chunk by chunk, adding up the counts and keeping a bounded sample of issues
+@timed_stage('run_streaming_quality_checks')
+def run_streaming_quality_checks(csv_file_path, chunksize, sample_per_issue=STREAMING_SAMPLE_PER_ISSUE):
+    frame_functions = streaming_frame_functions(csv_file_path, chunksize)
+    counts = None
+    issue_sample = None
+    
+    for chunk in read_csv_chunks(csv_file_path, chunksize):
+        chunk = run_data_quality_checks(chunk, streaming_frame_columns(chunk, frame_functions))
+        
+        chunk_counts = count_quality_issues(chunk)
+        counts = chunk_counts if counts is None else {
+            key: counts[key] + chunk_counts[key] for key in counts
+        }
+        
+        # Keep the first rows per issue type; chunks keep the file's row numbering
+        chunk_issues = build_issue_frame(chunk)
+        if issue_sample is not None:
+            chunk_issues = pd.concat([issue_sample, chunk_issues], ignore_index=True)
+        issue_sample = chunk_issues.groupby('issue_type', observed=True, sort=False).head(sample_per_issue)
+        issue_sample = issue_sample.sort_values(['issue_type', 'row_index'], kind='stable', ignore_index=True)
+    
+    if counts is None:
+        # Empty file: run the checks on the header alone so metrics and columns still exist
+        empty = run_data_quality_checks(convert_columns(pd.read_csv(csv_file_path, nrows=0)))
+        return calculate_quality_metrics(empty), build_issue_frame(empty)
+    
+    return summarize_quality_metrics(counts), issue_sample
+
+## Parallel mode across cores
+# Worker processes for the quality checks; 1 runs serially, None uses every core. Only used by
+# --precompute and batch runs: inside the dashboard the data loads next to the server threads, where
+# forking is not safe, so it runs serially.
+PARALLEL_WORKERS = 1
+
+# Run the checks on one row range and return its counts and issues
+def _quality_partition(data, start, stop):
+    df, frame_columns = data
+    chunk = run_data_quality_checks(df.iloc[start:stop],
+                                    {name: column.iloc[start:stop] for name, column in frame_columns.items()})
+    return count_quality_issues(chunk), build_issue_frame(chunk)
+
+# Run the checks on row ranges in a process pool and combine the partial results exactly. The
+# whole-frame columns are computed before forking and shared with the workers like the frame.
+@timed_stage('run_parallel_quality_checks')
+def run_parallel_quality_checks(df, workers=PARALLEL_WORKERS):
+    partitions = row_ranges(len(df), resolve_workers(workers))
+    frame_columns = compute_frame_columns(df)
+    results = map_partitions(_quality_partition, (df, frame_columns), partitions, workers)
+    if not results:
+        empty = run_data_quality_checks(df)
+        return calculate_quality_metrics(empty), build_issue_frame(empty)
+    
+    counts = {key: sum(part_counts[key] for part_counts, _ in results) for key in results[0][0]}
+    
+    # Restore the serial order: grouped by issue type, then by row
+    issue_frame = pd.concat([issues for _, issues in results], ignore_index=True)
+    issue_frame = issue_frame.sort_values(['issue_type', 'row_index'], kind='stable', ignore_index=True)
+    
+    return summarize_quality_metrics(counts), issue_frame
+
+# Rows the issues table pages through after filtering and sorting; a notice says when more issues match
+ISSUE_TABLE_MAX_RECORDS = 200000
+
+# Issue row positions per severity filter ('critical' / 'normal'), built once per data load;
+# 'all' is the issue frame itself
+issue_cache = {}
+
+# Split the issue frame by severity once so the table callback only does a lookup. Only row
+# positions are kept, so the cache never holds a copy of the issues.
+@timed_stage('build_issue_cache')
+def build_issue_cache(issue_frame):
+    severity = issue_frame['severity'].to_numpy()
+    return {name.lower(): np.flatnonzero(severity == name) for name in SEVERITY_COLORS}
+
+# Look up the issue rows for a severity filter, rebuilding the positions after a reload
+def get_issue_view(selected_type):
+    if not issue_cache:
+        issue_cache.update(build_issue_cache(issue_frame))
+    if selected_type not in issue_cache:
+        return issue_frame
+    return issue_frame.iloc[issue_cache[selected_type]]
+
+## Server-side filtering and sorting for the issues table
+# DataTable filter operators mapped to a canonical name (word and symbol forms)
+FILTER_OPERATORS = {
+    'eq': 'eq', '=': 'eq', 'ne': 'ne', '!=': 'ne',
+    'lt': 'lt', '<': 'lt', 'le': 'le', '<=': 'le',
+    'gt': 'gt', '>': 'gt', 'ge': 'ge', '>=': 'ge',
+    'contains': 'contains', 'datestartswith': 'datestartswith',
+}
+
+FILTER_PART_PATTERN = re.compile(
+    r'^\{(?P<column>[^}]+)\}\s+(?P<case>[si]?)(?P<operator>'
+    + '|'.join(re.escape(op) for op in sorted(FILTER_OPERATORS, key=len, reverse=True))
+    + r')\s+(?P<value>.+)$'
+)
+
+# Parse one "{column} operator value" clause of a DataTable filter query
+def split_filter_part(filter_part):
+    match = FILTER_PART_PATTERN.match(filter_part.strip())
+    if match is None:
+        return None, None, None, None
+    
+    value = match.group('value').strip()
+    if len(value) > 1 and value[0] == value[-1] and value[0] in ('"', "'", '`'):
+        value = value[1:-1].replace('\\' + value[0], value[0])
+    
+    # Like the DataTable's native filter, clauses are case-sensitive unless prefixed with 'i'
+    case_sensitive = match.group('case') != 'i'
+    return match.group('column'), FILTER_OPERATORS[match.group('operator')], value, case_sensitive
+
+# Evaluate one filter clause against a column as a vectorized boolean mask
+def filter_mask(column, operator, value, case_sensitive=True):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Evaluate on the few categories and broadcast through the codes
+        category_mask = filter_mask(pd.Series(column.cat.categories), operator, value, case_sensitive)
+        codes = column.cat.codes.to_numpy()
+        return pd.Series(np.append(category_mask.to_numpy(), False)[codes], index=column.index)
+    
+    if operator == 'ne':
+        return ~filter_mask(column, 'eq', value, case_sensitive)
+    
+    text = column.astype(str)
+    if operator == 'contains':
+        if case_sensitive:
+            return text.str.contains(value, regex=False)
+        return text.str.lower().str.contains(value.lower(), regex=False)
+    if operator == 'datestartswith':
+        return text.str.startswith(value)
+    
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    
+    if operator == 'eq':
+        mask = text == value if case_sensitive else text.str.lower() == value.lower()
+        if number is not None:
+            mask |= pd.to_numeric(column, errors='coerce') == number
+        return mask
+    
+    # Range comparisons are numeric when the value is a number, lexical otherwise
+    target = text if number is None else pd.to_numeric(column, errors='coerce')
+    compare = {'lt': target.lt, 'le': target.le, 'gt': target.gt, 'ge': target.ge}[operator]
+    return compare(value if number is None else number)
+
+# Apply a DataTable filter query ("clause && clause ...") to the issue frame
+@timed_stage('apply_filter_query')
+def apply_filter_query(frame, filter_query):
+    if not filter_query:
+        return frame
+    mask = pd.Series(True, index=frame.index)
+    for filter_part in filter_query.split(' && '):
+        column, operator, value, case_sensitive = split_filter_part(filter_part)
+        if column in frame.columns:
+            mask &= filter_mask(frame[column], operator, value, case_sensitive)
+    return frame[mask]
+
+# Sort key per column: categories alphabetically, numbers numerically, everything else as text
+def issue_sort_key(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.reorder_categories(sorted(column.cat.categories))
+    numeric = pd.to_numeric(column, errors='coerce')
+    if numeric.notna().all():
+        return numeric
+    return column.astype(str)
+
+# Filtered and sorted issue views as row positions in the issue frame, keyed by (severity, filter query,
+# sort columns). Only the positions are cached (4 bytes per row), never a copy of the rows.
+@lru_cache(maxsize=32)
+@timed_stage('query_issue_positions')
+def query_issue_positions(selected_type, filter_query, sort_by):
+    view = apply_filter_query(get_issue_view(selected_type), filter_query)
+    if sort_by:
+        view = view.sort_values(
+            [column for column, _ in sort_by],
+            ascending=[direction == 'asc' for _, direction in sort_by],
+            key=issue_sort_key,
+            kind='stable'
+        )
+    return issue_frame.index.get_indexer(view.index).astype(np.int32)
+
+## Shared results for multiple server processes
+# Keep the metrics and issues in a memory-mapped store next to the CSV: the first process computes
+# them and every other process (e.g. gunicorn workers) maps the same file instead of recomputing
+USE_RESULT_STORE = True
+
+# Metrics and issue frame computed from the CSV (streaming, in parallel or in one pass)
+def compute_quality_results(csv_file_path, chunksize=STREAMING_CHUNKSIZE, workers=PARALLEL_WORKERS):
+    if chunksize:
+        # The full frame is never held in memory when streaming
+        return run_streaming_quality_checks(csv_file_path, chunksize)
+    if resolve_workers(workers) > 1:
+        # Checked partitions stay in the workers; only counts and issues come back
+        return run_parallel_quality_checks(load_transactions(csv_file_path), workers)
+    df = run_data_quality_checks(load_transactions(csv_file_path))
+    record_frame_memory('quality_checked', df)
+    return calculate_quality_metrics(df), build_issue_frame(df)
+
+# Name of the stored result set; streaming keeps only a sample of the issues, and changed rules are recomputed
+def quality_store_name(chunksize):
+    sample = f"_sample{STREAMING_SAMPLE_PER_ISSUE}" if chunksize else ''
+    return f"quality{sample}_rules{QUALITY_RULES_VERSION}"
+
+# Run quality checks and calculate metrics, or map them from the result store; invalidates the issue cache.
+# Only the metrics and issues are kept; the checked frame is released once they are built.
+@timed_stage('load_data')
+def load_data(csv_file_path, chunksize=STREAMING_CHUNKSIZE, workers=PARALLEL_WORKERS):
+    global metrics, issue_frame
+    if USE_RESULT_STORE:
+        store_path = result_store_path(csv_file_path, quality_store_name(chunksize))
+        metrics, issue_frame = load_or_compute_results(
+            store_path, lambda: compute_quality_results(csv_file_path, chunksize, workers))
+    else:
+        metrics, issue_frame = compute_quality_results(csv_file_path, chunksize, workers)
+    issue_cache.clear()
+    query_issue_positions.cache_clear()
+
+# Generate dashboard content from the loaded metrics and issues
+@timed_stage('build_dashboard_content')
+def build_dashboard_content():
+    return [
+        # Summary Cards
+        dbc.Row([
+            dbc.Col(dbc.Card([
+                dbc.CardHeader("Total Records"),
+                dbc.CardBody([
+                    html.H4(f"{metrics['total_records']:,}", className="card-title")
+                ])
+            ], color="light", outline=True), md=3),
+            
+            dbc.Col(dbc.Card([
+                dbc.CardHeader("Data Quality Score"),
+                dbc.CardBody([
+                    html.H4(f"{metrics['quality_score']:.1f}%", className="card-title"),
+                    dcc.Graph(
+                        figure=px.bar(
+                            x=[metrics['quality_score']],
+                            orientation='h',
+                            range_x=[0, 100],
+                            text_auto=True
+                        ).update_layout(
+                            showlegend=False,
+                            margin=dict(l=0, r=0, t=0, b=0),
+                            xaxis=dict(showgrid=False, visible=False),
+                            yaxis=dict(visible=False),
+                            height=50
+                        ),
+                        config={'staticPlot': True},
+                        style={'height': '50px'}
+                    )
+                ])
+            ], color="primary", outline=True), md=3),
+            
+            dbc.Col(dbc.Card([
+                dbc.CardHeader("Critical Issues"),
+                dbc.CardBody([
+                    html.H4(f"{metrics['critical_issues']}", 
+                            className="card-title text-danger")
+                ])
+            ], color="danger", outline=True), md=3),
+            
+            dbc.Col(dbc.Card([
+                dbc.CardHeader("Last Updated"),
+                dbc.CardBody([
+                    html.H4(datetime.fromtimestamp(data_loader.loaded_at).strftime("%Y-%m-%d %H:%M"), 
+                    className="card-title")
+                ])
+            ], color="info", outline=True), md=3),
+        ], className="mb-4"),
+        
+        # Issue Breakdown
+        dbc.Row([
+            dbc.Col([
+                html.H4("Data Quality Issues Breakdown"),
                 dcc.Graph(
                     figure=px.bar(
-                        x=[metrics['quality_score']],
-                        orientation='h',
-                        range_x=[0, 100],
-                        text_auto=True
+                        x=[rule['issue_type'] for rule in QUALITY_RULES],
+                        y=[metrics[rule['metric']] for rule in QUALITY_RULES],
+                        labels={'x': 'Issue Type', 'y': 'Count'},
+                        color=[rule['severity'] for rule in QUALITY_RULES],
+                        color_discrete_map=SEVERITY_COLORS
                     ).update_layout(
-                        showlegend=False,
-                        margin=dict(l=0, r=0, t=0, b=0),
-                        xaxis=dict(showgrid=False, visible=False),
-                        yaxis=dict(visible=False),
-                        height=50
-                    ),
-                    config={'staticPlot': True},
-                    style={'height': '50px'}
+                        xaxis_title="Issue Type",
+                        yaxis_title="Number of Records Affected",
+                        legend_title="Issue Severity"
+                    )
                 )
-            ])
-        ], color="primary", outline=True), md=3),
-        
-        dbc.Col(dbc.Card([
-            dbc.CardHeader("Critical Issues"),
-            dbc.CardBody([
-                html.H4(f"{metrics['critical_issues']}", 
-                        className="card-title text-danger")
-            ])
-        ], color="danger", outline=True), md=3),
-        
-        dbc.Col(dbc.Card([
-            dbc.CardHeader("Last Updated"),
-            dbc.CardBody([
-                html.H4(datetime.now().strftime("%Y-%m-%d %H:%M"), 
-                className="card-title")
-            ])
-        ], color="info", outline=True), md=3),
-    ], className="mb-4"),
-    
-    # Issue Breakdown
-    dbc.Row([
-        dbc.Col([
-            html.H4("Data Quality Issues Breakdown"),
-            dcc.Graph(
-                figure=px.bar(
-                    x=['Dates', 'Customer ID', 'Quantity', 'Unit Price', 'Description', 'Total Price'],
-                    y=[
-                        metrics['date_issues'],
-                        metrics['customer_id_issues'],
-                        metrics['quantity_issues'],
-                        metrics['unit_price_issues'],
-                        metrics['description_issues'],
-                        metrics['total_price_issues']
-                    ],
-                    labels={'x': 'Issue Type', 'y': 'Count'},
-                    color=['Normal', 'Normal', 'Critical', 'Critical', 'Normal', 'Critical'],
-                    color_discrete_map={'Normal': '#1f77b4', 'Critical': '#ff7f0e'}
-                ).update_layout(
-                    xaxis_title="Issue Type",
-                    yaxis_title="Number of Records Affected",
-                    legend_title="Issue Severity"
+            ], md=6),
+            
+            dbc.Col([
+                html.H4("Data Quality Distribution"),
+                dcc.Graph(
+                    figure=px.pie(
+                        names=['Invalid Data', 'Valid Data'],
+                        values=[100 - metrics['quality_score'], metrics['quality_score']],
+                        hole=0.6,
+                        color_discrete_sequence=['#2ca02c','#d62728']
+                    )
                 )
-            )
-        ], md=6),
+            ], md=6)
+        ], className="mb-4"),
         
-        dbc.Col([
-            html.H4("Data Quality Distribution"),
-            dcc.Graph(
-                figure=px.pie(
-                    names=['Invalid Data', 'Valid Data'],
-                    values=[100 - metrics['quality_score'], metrics['quality_score']],
-                    hole=0.6,
-                    color_discrete_sequence=['#2ca02c','#d62728']
+        # Issue Type Filter and Detailed Issues Table
+        dbc.Row([
+            dbc.Col([
+                html.H4("Detailed Issue Records"),
+                dbc.Row([
+                    dbc.Col([
+                        html.Label("Filter by Issue Type:"),
+                        dcc.Dropdown(
+                            id='issue-type-filter',
+                            options=[{'label': 'All Issues', 'value': 'all'}] + [
+                                {'label': f"{severity} Issues ({', '.join(rule['issue_type'] for rule in QUALITY_RULES if rule['severity'] == severity)})",
+                                 'value': severity.lower()}
+                                for severity in SEVERITY_COLORS
+                            ],
+                            value='all',
+                            clearable=False,
+                            style={'width': '100%'}
+                        )
+                    ], width=6)
+                ], className="mb-3"),
+                
+                html.Div(id='issues-table-notice', className="text-muted mb-2"),
+                
+                dash_table.DataTable(
+                    id='issues-table',
+                    columns=[
+                        {"name": "Invoice No", "id": "invoice_no"},
+                        {"name": "Stock Code", "id": "stock_code"},
+                        {"name": "Issue Type", "id": "issue_type"},
+                        {"name": "Field Value", "id": "field_value"},
+                        {"name": "Description", "id": "description"},
+                        {"name": "Severity", "id": "severity"}
+                    ],
+                    page_current=0,
+                    page_size=10,
+                    page_action="custom",
+                    style_table={'overflowX': 'auto'},
+                    style_cell={
+                        'textAlign': 'left',
+                        'padding': '10px',
+                        'whiteSpace': 'normal',
+                        'height': 'auto'
+                    },
+                    filter_action="custom",
+                    filter_query='',
+                    sort_action="custom",
+                    sort_mode="multi",
+                    sort_by=[]
                 )
-            )
-        ], md=6)
-    ], className="mb-4"),
-    
-    # Issue Type Filter and Detailed Issues Table
-    dbc.Row([
-        dbc.Col([
-            html.H4("Detailed Issue Records"),
-            dbc.Row([
-                dbc.Col([
-                    html.Label("Filter by Issue Type:"),
-                    dcc.Dropdown(
-                        id='issue-type-filter',
-                        options=[
-                            {'label': 'All Issues', 'value': 'all'},
-                            {'label': 'Critical Issues (Quantity, Pricing)', 'value': 'critical'},
-                            {'label': 'Normal Issues (Dates, Descriptions)', 'value': 'normal'}
-                        ],
-                        value='all',
-                        clearable=False,
-                        style={'width': '300px'}
-                    )
-                ], width=6)
-            ], className="mb-3"),
-            
-            dash_table.DataTable(
-                id='issues-table',
-                columns=[
-                    {"name": "Invoice No", "id": "invoice_no"},
-                    {"name": "Stock Code", "id": "stock_code"},
-                    {"name": "Issue Type", "id": "issue_type"},
-                    {"name": "Field Value", "id": "field_value"},
-                    {"name": "Description", "id": "description"},
-                    {"name": "Severity", "id": "severity"}
-                ],
-                data=[
-                    {
-                        "invoice_no": row['InvoiceNo'],
-                        "stock_code": row['StockCode'],
-                        "issue_type": "Date Format",
-                        "field_value": row['InvoiceDate'],
-                        "description": "Invalid date format",
-                        "severity": "Normal"
-                    } for _, row in df[~df['invoice_date_valid']].iterrows()
-                ] + [
-                    {
-                        "invoice_no": row['InvoiceNo'],
-                        "stock_code": row['StockCode'],
-                        "issue_type": "Customer ID",
-                        "field_value": row['CustomerID'],
-                        "description": "Invalid customer ID",
-                        "severity": "Normal"
-                    } for _, row in df[~df['customer_id_valid']].iterrows()
-                ] + [
-                    {
-                        "invoice_no": row['InvoiceNo'],
-                        "stock_code": row['StockCode'],
-                        "issue_type": "Quantity",
-                        "field_value": row['Quantity'],
-                        "description": "Invalid quantity (not positive)",
-                        "severity": "Critical"
-                    } for _, row in df[~df['quantity_valid']].iterrows()
-                ] + [
-                    {
-                        "invoice_no": row['InvoiceNo'],
-                        "stock_code": row['StockCode'],
-                        "issue_type": "Unit Price",
-                        "field_value": row['UnitPrice'],
-                        "description": "Invalid unit price (not positive)",
-                        "severity": "Critical"
-                    } for _, row in df[~df['unit_price_valid']].iterrows()
-                ] + [
-                    {
-                        "invoice_no": row['InvoiceNo'],
-                        "stock_code": row['StockCode'],
-                        "issue_type": "Description",
-                        "field_value": row['Description'],
-                        "description": "Missing or empty description",
-                        "severity": "Normal"
-                    } for _, row in df[~df['description_valid']].iterrows()
-                ] + [
-                    {
-                        "invoice_no": row['InvoiceNo'],
-                        "stock_code": row['StockCode'],
-                        "issue_type": "Total Price",
-                        "field_value": f"Actual: {row['TotalPrice']}, Calculated: {row['calculated_total']}",
-                        "description": "Total doesn't match quantity × unit price",
-                        "severity": "Critical"
-                    } for _, row in df[~df['total_price_valid']].iterrows()
-                ],
-                page_size=10,
-                style_table={'overflowX': 'auto'},
-                style_cell={
-                    'textAlign': 'left',
-                    'padding': '10px',
-                    'whiteSpace': 'normal',
-                    'height': 'auto'
-                },
-                filter_action="native",
-                sort_action="native"
-            )
+            ])
         ])
-    ])
-], fluid=True)
-
-# Callback to filter table based on issue type
-@app.callback(
-    dash.dependencies.Output('issues-table', 'data'),
-    [dash.dependencies.Input('issue-type-filter', 'value')]
-)
-def update_table(selected_type):
-    all_data = [
-        {
-            "invoice_no": row['InvoiceNo'],
-            "stock_code": row['StockCode'],
-            "issue_type": "Date Format",
-            "field_value": row['InvoiceDate'],
-            "description": "Invalid date format",
-            "severity": "Normal"
-        } for _, row in df[~df['invoice_date_valid']].iterrows()
-    ] + [
-        {
-            "invoice_no": row['InvoiceNo'],
-            "stock_code": row['StockCode'],
-            "issue_type": "Customer ID",
-            "field_value": row['CustomerID'],
-            "description": "Invalid customer ID",
-            "severity": "Normal"
-        } for _, row in df[~df['customer_id_valid']].iterrows()
-    ] + [
-        {
-            "invoice_no": row['InvoiceNo'],
-            "stock_code": row['StockCode'],
-            "issue_type": "Quantity",
-            "field_value": row['Quantity'],
-            "description": "Invalid quantity (not positive)",
-            "severity": "Critical"
-        } for _, row in df[~df['quantity_valid']].iterrows()
-    ] + [
-        {
-            "invoice_no": row['InvoiceNo'],
-            "stock_code": row['StockCode'],
-            "issue_type": "Unit Price",
-            "field_value": row['UnitPrice'],
-            "description": "Invalid unit price (not positive)",
-            "severity": "Critical"
-        } for _, row in df[~df['unit_price_valid']].iterrows()
-    ] + [
-        {
-            "invoice_no": row['InvoiceNo'],
-            "stock_code": row['StockCode'],
-            "issue_type": "Description",
-            "field_value": row['Description'],
-            "description": "Missing or empty description",
-            "severity": "Normal"
-        } for _, row in df[~df['description_valid']].iterrows()
-    ] + [
-        {
-            "invoice_no": row['InvoiceNo'],
-            "stock_code": row['StockCode'],
-            "issue_type": "Total Price",
-            "field_value": f"Actual: {row['TotalPrice']}, Calculated: {row['calculated_total']}",
-            "description": "Total doesn't match quantity × unit price",
-            "severity": "Critical"
-        } for _, row in df[~df['total_price_valid']].iterrows()
     ]
+
+# Placeholder shown while the data is loading (or if loading failed)
+def build_loading_content():
+    if data_loader.status == 'failed':
+        return dbc.Alert(f"Loading the data failed: {data_loader.error}", color="danger")
+    return html.Div([
+        dbc.Spinner(color="primary"),
+        html.P("Running data quality checks...", className="mt-2")
+    ], className="text-center my-5")
+
+# Layout is rebuilt per page load; the interval swaps in the dashboard once the data is ready
+def serve_layout():
+    return dbc.Container([
+        html.H1("Retail Data Quality Dashboard", className="mb-4 text-center"),
+        html.Div(
+            build_dashboard_content() if data_loader.ready else build_loading_content(),
+            id='dashboard-content'
+        ),
+        dcc.Interval(id='loading-interval', interval=1000, disabled=data_loader.ready),
+        *diagnostics_components()
+    ], fluid=True)
+
+@timed_stage('callback show_dashboard_when_ready')
+def show_dashboard_when_ready(n_intervals):
+    if data_loader.ready:
+        return build_dashboard_content(), True
+    if data_loader.status == 'failed':
+        return build_loading_content(), True
+    return dash.no_update, False
+
+# Callback to filter, sort and page the table server-side based on issue type
+@timed_stage('callback update_table')
+def update_table(selected_type, page_current, page_size, sort_by, filter_query):
+    sort_key = tuple((col['column_id'], col['direction']) for col in sort_by or [])
+    positions = query_issue_positions(selected_type, filter_query or '', sort_key)
     
-    if selected_type == 'all':
-        return all_data
-    elif selected_type == 'critical':
-        return [x for x in all_data if x['severity'] == 'Critical']
-    elif selected_type == 'normal':
-        return [x for x in all_data if x['severity'] == 'Normal']
-    return all_data
+    # Only the first ISSUE_TABLE_MAX_RECORDS matching rows can be paged through
+    shown = min(len(positions), ISSUE_TABLE_MAX_RECORDS)
+    notice = None
+    if shown < len(positions):
+        notice = f"Showing the first {shown:,} of {len(positions):,} matching issues. Filter the table to see the rest."
+    
+    # Only the visible page is taken from the issue frame, converted to records and sent to the browser
+    start = (page_current or 0) * page_size
+    page_count = max(1, -(-shown // page_size))
+    page = issue_frame.iloc[positions[start:min(start + page_size, shown)]]
+    return issue_frame_to_records(page), page_count, notice
+
+# App factory: serves a loading page immediately and prepares the data in a background thread
+def create_app(csv_file_path=csv_file_path, preload=True):
+    global data_loader
+    data_loader = BackgroundLoader(lambda: load_data(csv_file_path), 'quality-dashboard')
+    
+    # Initialize the Dash app
+    app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP],
+                    suppress_callback_exceptions=True)
+    app.layout = serve_layout
+    data_loader.attach(app.server)
+    register_diagnostics(app, data_loader)
+    
+    app.callback(
+        [dash.dependencies.Output('dashboard-content', 'children'),
+         dash.dependencies.Output('loading-interval', 'disabled')],
+        [dash.dependencies.Input('loading-interval', 'n_intervals')]
+    )(show_dashboard_when_ready)
+    
+    app.callback(
+        [dash.dependencies.Output('issues-table', 'data'),
+         dash.dependencies.Output('issues-table', 'page_count'),
+         dash.dependencies.Output('issues-table-notice', 'children')],
+        [dash.dependencies.Input('issue-type-filter', 'value'),
+         dash.dependencies.Input('issues-table', 'page_current'),
+         dash.dependencies.Input('issues-table', 'page_size'),
+         dash.dependencies.Input('issues-table', 'sort_by'),
+         dash.dependencies.Input('issues-table', 'filter_query')]
+    )(update_table)
+    
+    if preload:
+        data_loader.start()
+    return app
 
 if __name__ == '__main__':
+    # --precompute writes the result store and exits, e.g. before starting several server workers
+    if '--precompute' in sys.argv[1:]:
+        load_data(csv_file_path)
+        sys.exit()
+    
+    # With debug=True the reloader's parent process only watches files, so only its child preloads
+    app = create_app(csv_file_path, preload=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
     app.run(debug=True)
\ No newline at end of file
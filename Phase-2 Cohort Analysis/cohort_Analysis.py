@@ -5,78 +5,1011 @@ import pandas as pd
 import plotly.express as px
 import numpy as np
 from datetime import datetime
+import contextlib
+import functools
+import hashlib
+import io
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict, defaultdict
 
-# Initialize the Dash app
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# Shared modules live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from transaction_cache import CACHE_FORMAT, load_transactions, read_typed_csv, source_fingerprint
+from result_store import load_or_compute_results, result_store_path
+from parallel_backend import map_partitions, resolve_workers
+from background_loader import BackgroundLoader
+from instrumentation import record_frame_memory, timed_stage
+from dashboard_diagnostics import diagnostics_components, register_diagnostics
+
+# Responses are gzip-compressed when flask-compress is installed
+try:
+    import flask_compress  # noqa: F401
+    COMPRESS_RESPONSES = True
+except ImportError:
+    COMPRESS_RESPONSES = False
 
 # Read CSV file
-csv_file_path = r"C:\Users\aakas\Downloads\projects\Business_analytical project\Project-4\Data\online_retail_final.csv"
-df = pd.read_csv(csv_file_path)
+# (set RETAIL_CSV_PATH to point the dashboard at another file, e.g. a synthetic benchmark file)
+csv_file_path = os.environ.get('RETAIL_CSV_PATH', r"C:\Users\aakas\Downloads\projects\Business_analytical project\Project-4\Data\online_retail_final.csv")
+
+# Persistent cohort state for incremental refreshes; None recomputes everything from csv_file_path
+cohort_state_path = None
+
+# Transaction files applied to the cohort state on refresh. Rows appended to a file since the last
+# refresh are applied on their own; a file changed in any other way is rejected.
+incremental_csv_paths = [csv_file_path]
+
+# Relative standard error for approximate (HyperLogLog) retention counts; None counts customers exactly
+retention_error_bound = None
+# Worker processes for cohort preparation and aggregation; 1 runs serially, None uses every core.
+# Only used by --precompute and batch runs: inside the dashboard the data loads next to the server
+# threads, where forking is not safe, so it runs serially.
+# Worker processes for cohort preparation and aggregation; 1 runs serially, None uses every core
+parallel_workers = 1
+
+# Persist the cohort matrices as a pre-aggregated cube next to the CSV; later launches load only the cube
+use_cohort_cube = True
+
+# Keep the loaded aggregates in a memory-mapped store next to the CSV: the first process computes them
+# and every other process (e.g. gunicorn workers) maps the same file. Not used with cohort_state_path.
+use_result_store = True
+
+# Cohort period shown first: 'daily', 'weekly', 'monthly' or 'quarterly' (the others stay selectable)
+cohort_granularity = 'monthly'
+
+# Days without a purchase after which a customer counts as churned
+churn_window_days = 90
+
+# Months of revenue included in the projected customer lifetime value
+clv_horizon_months = 12
+
+# Activity rows processed per chunk by the customer segmentation; bounds its working memory
+segment_chunk_rows = 2000000
+
+# Heatmaps with more cells than this are shown as averages over square blocks of cohorts and offsets
+heatmap_max_cells = 20000
+
+# Number of built figures kept in memory (full-range and filtered views of every granularity)
+figure_cache_size = 64
 
-# Convert InvoiceDate to datetime
-df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+# Columns the cohort analysis needs from the typed cache (InvoiceDate is already datetime)
+COHORT_COLUMNS = ['CustomerID', 'InvoiceDate', 'TotalPrice']
 
 ## Data Preparation for Cohort Analysis
-def prepare_cohort_data(df):
-    # Create cohort month (month of first purchase) as string
-    df['InvoiceMonth'] = df['InvoiceDate'].dt.to_period('M').astype(str)
+# Cohort periods, finest first; coarser ones are rolled up from the daily intermediate
+COHORT_GRANULARITIES = ['daily', 'weekly', 'monthly', 'quarterly']
+GRANULARITY_UNITS = {'daily': 'Day', 'weekly': 'Week', 'monthly': 'Month', 'quarterly': 'Quarter'}
+
+# Integer month ordinal (year * 12 + month - 1) of each date
+def month_ordinal(dates):
+    return dates.dt.year.astype('int64') * 12 + dates.dt.month.astype('int64') - 1
+
+# Format month ordinals as 'YYYY-MM' strings
+def format_month_ordinals(ordinals):
+    return [f"{ordinal // 12:04d}-{ordinal % 12 + 1:02d}" for ordinal in ordinals]
+
+# Integer day number (days since 1970-01-01) of each date
+def day_ordinal(dates):
+    return pd.Series(dates.to_numpy(dtype='datetime64[D]').astype('int64'), index=dates.index)
+
+# Period ordinal of day numbers: the day itself, Monday-based weeks, year * 12 + month - 1 or year * 4 + quarter - 1
+def period_ordinal(days, granularity):
+    days = np.asarray(days, dtype='int64')
+    if granularity == 'daily':
+        return days
+    if granularity == 'weekly':
+        # 1970-01-01 was a Thursday; shifting by 3 days makes every week start on a Monday
+        return (days + 3) // 7
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype('int64') + 1970 * 12
+    if granularity == 'monthly':
+        return months
+    if granularity == 'quarterly':
+        return months // 3
+    raise ValueError(f"Unknown cohort granularity: {granularity!r}")
+
+# Sortable labels for period ordinals: 'YYYY-MM-DD', ISO week 'YYYY-Www', 'YYYY-MM' or 'YYYY-Qn'
+def format_period_ordinals(ordinals, granularity):
+    ordinals = np.asarray(ordinals, dtype='int64')
+    if granularity == 'monthly':
+        return format_month_ordinals(ordinals)
+    if granularity == 'quarterly':
+        return [f"{ordinal // 4:04d}-Q{ordinal % 4 + 1}" for ordinal in ordinals]
+    days = ordinals if granularity == 'daily' else ordinals * 7 - 3
+    dates = pd.DatetimeIndex(days.astype('datetime64[D]'))
+    return list(dates.strftime('%Y-%m-%d' if granularity == 'daily' else '%G-W%V'))
+
+# Parse period labels back to period ordinals
+def parse_period_labels(labels, granularity):
+    labels = pd.Series(labels, dtype=str)
+    if granularity == 'monthly':
+        return parse_month_labels(labels)
+    if granularity == 'quarterly':
+        return (labels.str[:4].astype('int64') * 4 + labels.str[6:].astype('int64') - 1).to_numpy()
+    if granularity == 'daily':
+        return pd.to_datetime(labels, format='%Y-%m-%d').to_numpy(dtype='datetime64[D]').astype('int64')
+    mondays = pd.to_datetime(labels + '-1', format='%G-W%V-%u').to_numpy(dtype='datetime64[D]').astype('int64')
+    return period_ordinal(mondays, 'weekly')
+
+# Add CohortIndex (periods since first purchase) and CohortMonth (label of the first period)
+def add_cohort_columns(df, days, first_days, granularity):
+    period = period_ordinal(days, granularity)
+    cohort = period_ordinal(first_days, granularity)
+    
+    # Periods since first purchase is a plain integer difference, in the smallest integer type that fits
+    df['CohortIndex'] = pd.to_numeric(period - cohort, downcast='integer')
     
-    # Get first purchase month for each customer
-    df_cohort = df.groupby('CustomerID')['InvoiceMonth'].min().reset_index()
-    df_cohort.columns = ['CustomerID', 'CohortMonth']
+    # Only the distinct cohort periods are formatted as strings; rows keep small category codes
+    codes, uniques = pd.factorize(cohort, sort=True)
+    df['CohortMonth'] = pd.Categorical.from_codes(codes, categories=format_period_ordinals(uniques, granularity))
     
-    # Merge cohort info back to original dataframe
-    df = df.merge(df_cohort, on='CustomerID')
+    return df
+
+@timed_stage('prepare_cohort_data')
+def prepare_cohort_data(df, granularity='monthly'):
+    # Customers without an ID or rows without a valid date cannot be placed in a cohort
+    df = df[df['CustomerID'].notna() & df['InvoiceDate'].notna()].reset_index(drop=True)
     
-    # Convert cohort and invoice months to datetime for calculation
-    df['CohortMonthDT'] = pd.to_datetime(df['CohortMonth'])
-    df['InvoiceMonthDT'] = pd.to_datetime(df['InvoiceMonth'])
+    # Work on integer day numbers instead of string periods
+    days = day_ordinal(df['InvoiceDate'])
     
-    # Calculate months difference (alternative method that works)
-    df['CohortIndex'] = (
-        (df['InvoiceMonthDT'].dt.year - df['CohortMonthDT'].dt.year) * 12 +
-        (df['InvoiceMonthDT'].dt.month - df['CohortMonthDT'].dt.month)
-    )
+    # First purchase day for each customer, broadcast back to every row without a merge
+    first_days = days.groupby(df['CustomerID']).transform('min')
     
-    return df
+    return add_cohort_columns(df, days, first_days, granularity)
 
-# Prepare cohort data
-df = prepare_cohort_data(df)
+## Shared daily intermediate for every granularity
+# Revenue per distinct (customer, day) and each customer's first purchase day. Every granularity
+# is rolled up from this table instead of rescanning the transactions. Rows are sorted by customer
+# and day, so each customer's activity is one contiguous run (used by the segmentation).
+@timed_stage('build_daily_activity')
+def build_daily_activity(df):
+    df = df[df['CustomerID'].notna() & df['InvoiceDate'].notna()]
+    days = day_ordinal(df['InvoiceDate']).rename('Day')
+    
+    activity = df['TotalPrice'].groupby([df['CustomerID'], days]).sum().reset_index()
+    activity['Day'] = pd.to_numeric(activity['Day'], downcast='integer')
+    activity['FirstDay'] = activity.groupby('CustomerID')['Day'].transform('min')
+    return activity
 
-# Create cohort analysis metrics
-def create_cohort_metrics(df):
-    # Cohort size (number of unique customers per cohort)
-    cohort_size = df.groupby('CohortMonth')['CustomerID'].nunique().reset_index()
-    cohort_size.columns = ['CohortMonth', 'TotalCustomers']
+# Cohort rows at one granularity from the daily intermediate (input for the matrix and sketch kernels)
+@timed_stage('rollup_cohort_data')
+def rollup_cohort_data(activity, granularity='monthly'):
+    return add_cohort_columns(activity.copy(deep=False), activity['Day'], activity['FirstDay'], granularity)
+
+## Cohort aggregation kernel
+# Dense cohort x offset matrices of active customers and revenue, filled in one pass over integer codes
+@timed_stage('build_cohort_matrices')
+def build_cohort_matrices(df):
+    cohort_codes, cohorts = pd.factorize(df['CohortMonth'], sort=True)
+    customer_codes, customers = pd.factorize(df['CustomerID'])
+    offsets = df['CohortIndex'].to_numpy(dtype='int64')
+    n_cohorts = len(cohorts)
+    n_offsets = int(offsets.max()) + 1 if len(offsets) else 0
+    
+    # Reduce to distinct (customer, offset) pairs; the cohort follows from the customer
+    customer_cohort = np.empty(len(customers), dtype='int64')
+    customer_cohort[customer_codes] = cohort_codes
+    pairs = pd.unique(customer_codes.astype('int64') * n_offsets + offsets)
+    pair_cells = customer_cohort[pairs // n_offsets] * n_offsets + pairs % n_offsets
+    active = np.bincount(pair_cells, minlength=n_cohorts * n_offsets).reshape(n_cohorts, n_offsets)
+    
+    # Revenue per cell summed straight from the rows (missing prices count as zero, like groupby sum)
+    cells = cohort_codes.astype('int64') * n_offsets + offsets
+    prices = np.nan_to_num(df['TotalPrice'].to_numpy(dtype='float64'))
+    revenue = np.bincount(cells, weights=prices, minlength=n_cohorts * n_offsets).reshape(n_cohorts, n_offsets)
+    
+    return {
+        'cohorts': np.asarray(cohorts),
+        'offsets': np.arange(n_offsets),
+        'active': active,
+        'revenue': revenue,
+        # Every customer is active in their first month, so offset 0 holds the cohort size
+        'cohort_size': active[:, 0] if n_offsets else np.zeros(n_cohorts, dtype='int64'),
+    }
+
+# Long-format cohort size, retention and revenue tables from the cohort matrices
+@timed_stage('cohort_metrics_from_matrices')
+def cohort_metrics_from_matrices(matrices):
+    cohort_size = pd.DataFrame({
+        'CohortMonth': matrices['cohorts'],
+        'TotalCustomers': matrices['cohort_size'],
+    })
+    
+    # Only cells with at least one active customer exist, as in a groupby
+    cohort_idx, offset_idx = np.nonzero(matrices['active'])
+    cells = pd.DataFrame({
+        'CohortMonth': matrices['cohorts'][cohort_idx],
+        'CohortIndex': matrices['offsets'][offset_idx],
+    })
+    total_customers = matrices['cohort_size'][cohort_idx]
     
     # Retention analysis
-    retention = df.groupby(['CohortMonth', 'CohortIndex'])['CustomerID'].nunique().reset_index()
-    retention = retention.merge(cohort_size, on='CohortMonth')
+    retention = cells.assign(
+        CustomerID=matrices['active'][cohort_idx, offset_idx],
+        TotalCustomers=total_customers,
+    )
     retention['RetentionRate'] = retention['CustomerID'] / retention['TotalCustomers']
     
     # Revenue analysis
-    revenue = df.groupby(['CohortMonth', 'CohortIndex'])['TotalPrice'].sum().reset_index()
-    revenue = revenue.merge(cohort_size, on='CohortMonth')
+    revenue = cells.assign(
+        TotalPrice=matrices['revenue'][cohort_idx, offset_idx],
+        TotalCustomers=total_customers,
+    )
     revenue['AvgRevenuePerCustomer'] = revenue['TotalPrice'] / revenue['TotalCustomers']
     
     return cohort_size, retention, revenue
 
-# Create cohort metrics
-cohort_size, retention, revenue = create_cohort_metrics(df)
+# Create cohort analysis metrics
+def create_cohort_metrics(df):
+    return cohort_metrics_from_matrices(build_cohort_matrices(df))
+
+# Exact matrices (or HLL sketches) for several granularities, rolled up from the daily intermediate
+def aggregate_daily_activity(activity, granularities, error_bound=None):
+    record_frame_memory('daily_activity', activity)
+    
+    aggregates = {}
+    for granularity in granularities:
+        prepared = rollup_cohort_data(activity, granularity)
+        if error_bound:
+            aggregates[granularity] = build_cohort_sketch(prepared, error_bound, granularity)
+        else:
+            aggregates[granularity] = dict(build_cohort_matrices(prepared), granularity=granularity)
+    return aggregates
+
+# Same, from one pass over the transactions
+def build_granular_cohort_aggregates(df, granularities, error_bound=None):
+    return aggregate_daily_activity(build_daily_activity(df), granularities, error_bound)
+
+# Cohort matrices per granularity from the daily intermediate
+@timed_stage('cohort_matrices_from_activity')
+def cohort_matrices_from_activity(activity, granularities=COHORT_GRANULARITIES, error_bound=None):
+    aggregates = aggregate_daily_activity(activity, granularities, error_bound)
+    if error_bound:
+        return {granularity: cohort_matrices_from_sketch(sketch) for granularity, sketch in aggregates.items()}
+    return aggregates
+
+# Cohort matrices per granularity, computed serially
+@timed_stage('build_granular_cohort_matrices')
+def build_granular_cohort_matrices(df, granularities=COHORT_GRANULARITIES, error_bound=None):
+    return cohort_matrices_from_activity(build_daily_activity(df), granularities, error_bound)
+
+## Incremental cohort state
+# Empty state: first purchase month and per-month revenue per customer, plus per-cell totals
+def new_cohort_state():
+    return {
+        'first_month': {},
+        'customer_months': {},
+        'cell_active': defaultdict(int),
+        'cell_revenue': defaultdict(float),
+        # Per file path: bytes applied so far and the hash of the last of those bytes
+        'applied_files': {},
+    }
+
+# Add or remove one customer's (month -> revenue) activity to the cells of their cohort
+def _apply_customer_months(state, first_month, months, sign):
+    for month, amount in months.items():
+        cell = (first_month, month - first_month)
+        state['cell_active'][cell] += sign
+        state['cell_revenue'][cell] += sign * amount
+
+# Fold a batch of new transactions into the state, touching only the customers in the batch
+@timed_stage('update_cohort_state')
+def update_cohort_state(state, batch):
+    batch = batch[batch['CustomerID'].notna() & batch['InvoiceDate'].notna()]
+    
+    # Reduce the batch to revenue per distinct (customer, month) before any Python-level work
+    pairs = batch['TotalPrice'].groupby(
+        [batch['CustomerID'], month_ordinal(batch['InvoiceDate']).rename('Month')]
+    ).sum()
+    
+    for customer, customer_pairs in pairs.groupby(level=0, sort=False):
+        months = customer_pairs.droplevel(0)
+        batch_first = int(months.index.min())
+        known = state['customer_months'].get(customer)
+        
+        if known is None:
+            known = state['customer_months'][customer] = {}
+            state['first_month'][customer] = batch_first
+        elif batch_first < state['first_month'][customer]:
+            # Backdated purchase: move the customer's history into the earlier cohort
+            _apply_customer_months(state, state['first_month'][customer], known, -1)
+            state['first_month'][customer] = batch_first
+            _apply_customer_months(state, batch_first, known, 1)
+        
+        first_month = state['first_month'][customer]
+        for month, amount in months.items():
+            cell = (first_month, int(month) - first_month)
+            if month not in known:
+                known[month] = 0.0
+                state['cell_active'][cell] += 1
+            known[month] += amount
+            state['cell_revenue'][cell] += amount
+    
+    return state
+
+# Dense cohort matrices (same layout as build_cohort_matrices) from the state's cell totals
+@timed_stage('cohort_matrices_from_state')
+def cohort_matrices_from_state(state):
+    cells = [cell for cell, count in state['cell_active'].items() if count > 0]
+    cohort_ordinals = sorted({cohort for cohort, _ in cells})
+    n_offsets = max((offset for _, offset in cells), default=-1) + 1
+    row_of = {cohort: row for row, cohort in enumerate(cohort_ordinals)}
+    
+    active = np.zeros((len(cohort_ordinals), n_offsets), dtype='int64')
+    revenue = np.zeros((len(cohort_ordinals), n_offsets))
+    for cohort, offset in cells:
+        active[row_of[cohort], offset] = state['cell_active'][(cohort, offset)]
+        revenue[row_of[cohort], offset] = state['cell_revenue'][(cohort, offset)]
+    
+    return {
+        'cohorts': np.array(format_month_ordinals(cohort_ordinals), dtype=object),
+        'offsets': np.arange(n_offsets),
+        'active': active,
+        'revenue': revenue,
+        'cohort_size': active[:, 0] if n_offsets else np.zeros(0, dtype='int64'),
+        # The state tracks customers per month
+        'granularity': 'monthly',
+    }
+
+def load_cohort_state(state_path):
+    if not os.path.exists(state_path):
+        return new_cohort_state()
+    with open(state_path, 'rb') as f:
+        state = pickle.load(f)
+    if not isinstance(state['applied_files'], dict) or any(
+            'tail_hash' not in applied for applied in state['applied_files'].values()):
+        raise ValueError(f"{state_path} was written by an older version without applied offsets; "
+                         "delete it to rebuild the state")
+    return state
+
+def save_cohort_state(state, state_path):
+    tmp_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, state_path)
+
+# Bytes before the applied offset that are hashed to detect edits of an applied file, so a refresh
+# reads only this window and the new rows instead of the whole file
+applied_tail_bytes = 1 << 16
+
+# Hash of the applied_tail_bytes bytes of a file that end at byte offset end
+def tail_hash(path, end):
+    with open(path, 'rb') as f:
+        f.seek(max(0, end - applied_tail_bytes))
+        return hashlib.sha1(f.read(end - f.tell())).hexdigest()
+
+# Typed cohort columns of the complete rows between byte offset and size of a CSV (the header is taken
+# from the top of the file), and the offset after the last of them. Bytes written after size was taken,
+# and a last line still being written, are left for the next refresh.
+def read_appended_rows(path, offset, size):
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(max(offset, f.tell()))
+        start = f.tell()
+        appended = f.read(max(0, size - start))
+    appended = appended[:appended.rfind(b'\n') + 1]
+    return read_typed_csv(io.BytesIO(header + appended))[COHORT_COLUMNS], start + len(appended)
+
+# Apply new transaction files, and rows appended to files already applied, to the persisted state and
+# return the refreshed matrices. Each file's applied byte count and the hash of the bytes just before it
+# are kept, so appended rows are applied exactly once; a file whose applied part changed (checked on that
+# window and on the file not having shrunk) cannot be refreshed.
+@timed_stage('refresh_cohort_state')
+def refresh_cohort_state(state_path, csv_paths):
+    state = load_cohort_state(state_path)
+    
+    changed = False
+    for path in csv_paths:
+        key = os.path.abspath(path)
+        size = os.path.getsize(path)
+        applied = state['applied_files'].get(key, {'bytes': 0, 'tail_hash': None})
+        if applied['tail_hash'] is not None and (
+                size < applied['bytes'] or tail_hash(path, applied['bytes']) != applied['tail_hash']):
+            raise ValueError(f"{path} changed other than by appending rows since it was applied to "
+                             f"{state_path}; delete the state to rebuild it")
+        if size == applied['bytes']:
+            continue
+        
+        rows, end = read_appended_rows(path, applied['bytes'], size)
+        if end == applied['bytes']:
+            continue
+        update_cohort_state(state, rows)
+        state['applied_files'][key] = {'bytes': end, 'tail_hash': tail_hash(path, end)}
+        changed = True
+    
+    if changed:
+        save_cohort_state(state, state_path)
+    return cohort_matrices_from_state(state)
+
+# Check that the persisted state equals a full recomputation from the same files
+@timed_stage('check_cohort_state')
+def check_cohort_state(state_path, csv_paths):
+    incremental = cohort_matrices_from_state(load_cohort_state(state_path))
+    transactions = pd.concat([load_transactions(path, columns=COHORT_COLUMNS) for path in csv_paths],
+                             ignore_index=True)
+    full = build_granular_cohort_matrices(transactions, ['monthly'])['monthly']
+    return (list(incremental['cohorts']) == list(full['cohorts'])
+            and np.array_equal(incremental['active'], full['active'])
+            and np.allclose(incremental['revenue'], full['revenue']))
+
+## Approximate distinct customers (HyperLogLog)
+# Number of index bits p so that the standard error 1.04 / sqrt(2 ** p) stays within the bound
+def hll_precision(error_bound):
+    return int(np.clip(np.ceil(np.log2((1.04 / error_bound) ** 2)), 4, 18))
+
+# Relative standard error of a sketch with precision p
+def hll_relative_error(precision):
+    return 1.04 / np.sqrt(2 ** precision)
+
+# Register index (top p bits) and rank (leading zeros + 1 of the remaining bits) per 64-bit hash
+def hll_index_and_rank(hashes, precision):
+    p = np.uint64(precision)
+    index = (hashes >> (np.uint64(64) - p)).astype('int64')
+    
+    # Count leading zeros of the remaining bits with a branch-free binary search
+    w = hashes << p
+    zeros = np.zeros(len(hashes), dtype='int64')
+    for shift in (32, 16, 8, 4, 2, 1):
+        top_empty = w < (np.uint64(1) << np.uint64(64 - shift))
+        zeros += top_empty * shift
+        w = np.where(top_empty, w << np.uint64(shift), w)
+    
+    rank = np.minimum(zeros + 1, 64 - precision + 1).astype('uint8')
+    return index, rank
+
+# Highest rank per register key (cell * m + register index), as sorted keys and their ranks
+def hll_max_ranks(keys, ranks):
+    best = pd.Series(ranks).groupby(keys).max()
+    return best.index.to_numpy(dtype='int64'), best.to_numpy(dtype='uint8')
+
+# Cardinality estimate per cell from its non-empty registers (sparse keys and ranks; every other
+# register of a cell is zero), with the small-range correction. Cells without registers are 0.
+def hll_estimate(keys, ranks, n_cells, m):
+    cells = keys // m
+    filled = np.bincount(cells, minlength=n_cells)
+    empty = m - filled
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / (empty + np.bincount(cells, weights=np.exp2(-ranks.astype('float64')), minlength=n_cells))
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(empty, 1))
+    return np.where(filled > 0, np.where((raw <= 2.5 * m) & (empty > 0), linear, raw), 0.0)
+
+# Parse 'YYYY-MM' cohort labels back to month ordinals
+def parse_month_labels(labels):
+    labels = pd.Series(labels, dtype=str)
+    return (labels.str[:4].astype('int64') * 12 + labels.str[5:7].astype('int64') - 1).to_numpy()
+
+# Mergeable sketch of a prepared frame: HLL registers and revenue per (cohort, offset) cell.
+# Cohorts are stored as a contiguous range of period ordinals starting at 'first_cohort'. Registers
+# are sparse: only the non-empty ones are kept, as keys (cell * 2^p + register index) and ranks, so a
+# sketch never holds more registers than the frame has rows, whatever the precision and granularity.
+@timed_stage('build_cohort_sketch')
+def build_cohort_sketch(df, error_bound, granularity='monthly'):
+    precision = hll_precision(error_bound)
+    m = 2 ** precision
+    
+    cohort_codes, cohort_labels = pd.factorize(df['CohortMonth'])
+    cohort_ordinals = parse_period_labels(cohort_labels, granularity)[cohort_codes]
+    offsets = df['CohortIndex'].to_numpy(dtype='int64')
+    first_cohort = int(cohort_ordinals.min()) if len(df) else 0
+    n_cohorts = int(cohort_ordinals.max()) - first_cohort + 1 if len(df) else 0
+    n_offsets = int(offsets.max()) + 1 if len(df) else 0
+    cells = (cohort_ordinals - first_cohort) * n_offsets + offsets
+    
+    hashes = pd.util.hash_pandas_object(df['CustomerID'], index=False).to_numpy()
+    index, rank = hll_index_and_rank(hashes, precision)
+    
+    # Keep the highest rank per (cell, register)
+    register_keys, register_ranks = hll_max_ranks(cells * m + index, rank)
+    
+    prices = np.nan_to_num(df['TotalPrice'].to_numpy(dtype='float64'))
+    revenue = np.bincount(cells, weights=prices, minlength=n_cohorts * n_offsets)
+    
+    return {
+        'precision': precision,
+        'granularity': granularity,
+        'first_cohort': first_cohort,
+        'register_keys': register_keys,
+        'register_ranks': register_ranks,
+        'revenue': revenue.reshape(n_cohorts, n_offsets),
+    }
+
+# Merge two sketches of disjoint or overlapping customers (e.g. chunks or partitions by customer)
+def merge_cohort_sketches(a, b):
+    if a['precision'] != b['precision']:
+        raise ValueError("Cannot merge sketches with different precision")
+    if a['granularity'] != b['granularity']:
+        raise ValueError("Cannot merge sketches of different granularities")
+    
+    # An empty sketch has no meaningful cohort range
+    if a['revenue'].size == 0:
+        return b
+    if b['revenue'].size == 0:
+        return a
+    
+    first_cohort = min(a['first_cohort'], b['first_cohort'])
+    last_cohort = max(a['first_cohort'] + a['revenue'].shape[0], b['first_cohort'] + b['revenue'].shape[0])
+    n_offsets = max(a['revenue'].shape[1], b['revenue'].shape[1])
+    m = 2 ** a['precision']
+    
+    keys = []
+    revenue = np.zeros((last_cohort - first_cohort, n_offsets))
+    for sketch in (a, b):
+        row_shift = sketch['first_cohort'] - first_cohort
+        rows = slice(row_shift, row_shift + sketch['revenue'].shape[0])
+        cols = slice(0, sketch['revenue'].shape[1])
+        revenue[rows, cols] += sketch['revenue']
+        
+        # Re-key the registers to the merged cohort range and offset count
+        cells, index = np.divmod(sketch['register_keys'], m)
+        cohort, offset = np.divmod(cells, sketch['revenue'].shape[1])
+        keys.append(((cohort + row_shift) * n_offsets + offset) * m + index)
+    
+    register_keys, register_ranks = hll_max_ranks(
+        np.concatenate(keys), np.concatenate([a['register_ranks'], b['register_ranks']]))
+    return {'precision': a['precision'], 'granularity': a['granularity'], 'first_cohort': first_cohort,
+            'register_keys': register_keys, 'register_ranks': register_ranks, 'revenue': revenue}
+
+# Cohort matrices (same layout as build_cohort_matrices) with estimated active customers
+@timed_stage('cohort_matrices_from_sketch')
+def cohort_matrices_from_sketch(sketch):
+    n_cohorts, n_offsets = sketch['revenue'].shape
+    active = hll_estimate(sketch['register_keys'], sketch['register_ranks'], n_cohorts * n_offsets,
+                          2 ** sketch['precision']).reshape(n_cohorts, n_offsets)
+    
+    # Drop periods inside the cohort range that have no customers
+    keep = active[:, 0] > 0 if active.shape[1] else np.zeros(active.shape[0], dtype=bool)
+    cohort_ordinals = sketch['first_cohort'] + np.flatnonzero(keep)
+    
+    return {
+        'cohorts': np.array(format_period_ordinals(cohort_ordinals, sketch['granularity']), dtype=object),
+        'offsets': np.arange(active.shape[1]),
+        'active': active[keep],
+        'revenue': sketch['revenue'][keep],
+        'cohort_size': active[keep, 0] if active.shape[1] else np.zeros(0),
+        'relative_error': hll_relative_error(sketch['precision']),
+        'granularity': sketch['granularity'],
+    }
+
+## Parallel cohort computation partitioned by customer
+# Combine cohort matrices of disjoint customer sets; distinct counts simply add up
+def merge_cohort_matrices(a, b):
+    cohorts = np.union1d(a['cohorts'].astype(str), b['cohorts'].astype(str))
+    n_offsets = max(len(a['offsets']), len(b['offsets']))
+    
+    active = np.zeros((len(cohorts), n_offsets), dtype=a['active'].dtype)
+    revenue = np.zeros((len(cohorts), n_offsets))
+    for part in (a, b):
+        rows = np.searchsorted(cohorts, part['cohorts'].astype(str))
+        active[rows, :len(part['offsets'])] += part['active']
+        revenue[rows, :len(part['offsets'])] += part['revenue']
+    
+    return {
+        'cohorts': cohorts.astype(object),
+        'offsets': np.arange(n_offsets),
+        'active': active,
+        'revenue': revenue,
+        'cohort_size': active[:, 0] if n_offsets else np.zeros(len(cohorts), dtype=active.dtype),
+    }
+
+# Aggregate the customers of one hash partition at every requested granularity
+def _cohort_partition(data, part, error_bound, granularities):
+    df, partition_ids = data
+    return build_granular_cohort_aggregates(df[partition_ids == part], granularities, error_bound)
+
+# Cohort matrices per granularity computed in a process pool, one partition per hash bucket of
+# CustomerID so that each customer's first purchase and distinct counts stay within a single worker
+@timed_stage('build_cohort_matrices_parallel')
+def build_cohort_matrices_parallel(df, workers=parallel_workers, error_bound=None, granularities=COHORT_GRANULARITIES):
+    n_partitions = resolve_workers(workers)
+    hashes = pd.util.hash_pandas_object(df['CustomerID'], index=False).to_numpy()
+    partition_ids = (hashes % np.uint64(n_partitions)).astype('int64')
+    
+    parts = map_partitions(_cohort_partition, (df, partition_ids),
+                           [(part, error_bound, granularities) for part in range(n_partitions)], workers)
+    
+    merge = merge_cohort_sketches if error_bound else merge_cohort_matrices
+    matrices = {}
+    for granularity in granularities:
+        combined = parts[0][granularity]
+        for part in parts[1:]:
+            combined = merge(combined, part[granularity])
+        if error_bound:
+            matrices[granularity] = cohort_matrices_from_sketch(combined)
+        else:
+            matrices[granularity] = dict(combined, granularity=granularity)
+    return matrices
+
+## Pre-aggregated cohort cube
+# Cube files are written next to the source CSV in this folder, one per source version, granularity and counting mode
+COHORT_CUBE_DIR_NAME = '.cohort_cube'
+
+# Long (cohort month x offset) table of the non-empty cells; the sketch error bound travels in attrs
+@timed_stage('cohort_cube_from_matrices')
+def cohort_cube_from_matrices(matrices):
+    cohort_idx, offset_idx = np.nonzero(matrices['active'])
+    cube = pd.DataFrame({
+        'CohortMonth': pd.Categorical.from_codes(cohort_idx, categories=list(matrices['cohorts'])),
+        'CohortIndex': pd.to_numeric(matrices['offsets'][offset_idx], downcast='integer'),
+        'ActiveCustomers': matrices['active'][cohort_idx, offset_idx],
+        'Revenue': matrices['revenue'][cohort_idx, offset_idx],
+    })
+    cube.attrs['granularity'] = matrices.get('granularity', 'monthly')
+    if 'relative_error' in matrices:
+        cube.attrs['relative_error'] = matrices['relative_error']
+    return cube
+
+# Dense cohort matrices (same layout as build_cohort_matrices) from a cube
+@timed_stage('cohort_matrices_from_cube')
+def cohort_matrices_from_cube(cube):
+    cohort_codes, cohorts = pd.factorize(cube['CohortMonth'].astype(str), sort=True)
+    offsets = cube['CohortIndex'].to_numpy(dtype='int64')
+    n_offsets = int(offsets.max()) + 1 if len(cube) else 0
+    
+    active = np.zeros((len(cohorts), n_offsets), dtype=cube['ActiveCustomers'].dtype)
+    active[cohort_codes, offsets] = cube['ActiveCustomers'].to_numpy()
+    revenue = np.zeros((len(cohorts), n_offsets))
+    revenue[cohort_codes, offsets] = cube['Revenue'].to_numpy()
+    
+    matrices = {
+        'cohorts': np.asarray(cohorts, dtype=object),
+        'offsets': np.arange(n_offsets),
+        'active': active,
+        'revenue': revenue,
+        'cohort_size': active[:, 0] if n_offsets else np.zeros(len(cohorts), dtype=active.dtype),
+        'granularity': cube.attrs.get('granularity', 'monthly'),
+    }
+    if 'relative_error' in cube.attrs:
+        matrices['relative_error'] = cube.attrs['relative_error']
+    return matrices
+
+# Location of the cube for the current version of the source file, the granularity and the counting mode
+def cohort_cube_path(csv_file_path, error_bound=None, granularity='monthly'):
+    mode = f"{granularity}_hll{hll_precision(error_bound)}" if error_bound else f"{granularity}_exact"
+    return cube_file_path(csv_file_path, mode)
+
+# Path of any aggregate table persisted next to the cohort cubes (e.g. the segment tables)
+def cube_file_path(csv_file_path, mode):
+    source_dir, source_name = os.path.split(os.path.abspath(csv_file_path))
+    stem = os.path.splitext(source_name)[0]
+    extension = 'parquet' if CACHE_FORMAT == 'parquet' else 'pkl'
+    return os.path.join(source_dir, COHORT_CUBE_DIR_NAME,
+                        f"{stem}-{source_fingerprint(csv_file_path)}-{mode}.{extension}")
+
+def load_cohort_cube(cube_path):
+    if CACHE_FORMAT == 'parquet':
+        return pd.read_parquet(cube_path)
+    return pd.read_pickle(cube_path)
+
+# Write the cube atomically and remove cubes of older versions of the same source, granularity and mode
+def save_cohort_cube(cube, cube_path):
+    cube_dir, cube_name = os.path.split(cube_path)
+    os.makedirs(cube_dir, exist_ok=True)
+    
+    tmp_path = f"{cube_path}.{os.getpid()}.tmp"
+    if CACHE_FORMAT == 'parquet':
+        cube.to_parquet(tmp_path, index=False)
+    else:
+        cube.to_pickle(tmp_path)
+    os.replace(tmp_path, cube_path)
+    
+    # Names are '<stem>-<fingerprint>-<mode>.<ext>'; the stem itself may contain dashes
+    base, extension = os.path.splitext(cube_name)
+    stem, _, mode = base.rsplit('-', 2)
+    for name in os.listdir(cube_dir):
+        other_base, other_extension = os.path.splitext(name)
+        if other_extension == extension and other_base.rsplit('-', 2)[::2] == [stem, mode] and name != cube_name:
+            # Another process may have removed it first
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(cube_dir, name))
+
+# View of the matrices for a cohort range and a maximum offset; only array slices, no recomputation
+def slice_cohort_matrices(matrices, first_cohort=None, last_cohort=None, max_offset=None):
+    cohorts = matrices['cohorts']
+    start = 0 if first_cohort is None else int(np.searchsorted(cohorts, first_cohort, side='left'))
+    stop = len(cohorts) if last_cohort is None else int(np.searchsorted(cohorts, last_cohort, side='right'))
+    n_offsets = len(matrices['offsets'])
+    if max_offset is not None:
+        n_offsets = max(0, min(int(max_offset) + 1, n_offsets))
+    
+    sliced = dict(matrices)
+    sliced.update(
+        cohorts=cohorts[start:stop],
+        offsets=matrices['offsets'][:n_offsets],
+        active=matrices['active'][start:stop, :n_offsets],
+        revenue=matrices['revenue'][start:stop, :n_offsets],
+        # Cohort sizes stay the full first-month counts even when offsets are cut
+        cohort_size=matrices['cohort_size'][start:stop],
+    )
+    return sliced
+
+## Customer segmentation (RFM) and lifetime value
+SEGMENTS = ['Champions', 'Loyal Customers', 'Potential Loyalists', 'New Customers', 'At Risk', 'Hibernating', 'Lost']
+
+# Segment (index into SEGMENTS) for each recency score (rows, 1-5) and frequency/monetary score (columns, 1-5)
+SEGMENT_GRID = np.array([
+    [6, 6, 4, 4, 4],
+    [5, 5, 4, 4, 4],
+    [2, 2, 1, 1, 1],
+    [3, 2, 1, 0, 0],
+    [3, 2, 1, 0, 0],
+])
+
+# Histogram edges for the revenue quintiles: revenue <= 0 in the first bin, then ~2.3% wide log bins
+MONETARY_EDGES = np.concatenate([[0.0], np.logspace(-2, 9, 1101)])
+
+# Row ranges of the customer-sorted activity of about chunk_rows rows each, cut at customer boundaries
+def customer_chunks(activity, chunk_rows):
+    customers = activity['CustomerID']
+    start = 0
+    while start < len(activity):
+        stop = min(start + chunk_rows, len(activity))
+        if stop < len(activity):
+            stop = int(customers.searchsorted(customers.iloc[stop - 1], side='right'))
+        yield start, stop
+        start = stop
+
+# Per-customer reductions over one chunk: first row, first and last purchase day, purchase days, revenue
+def customer_features(chunk):
+    ids = chunk['CustomerID'].to_numpy(dtype='int64')
+    days = chunk['Day'].to_numpy(dtype='int64')
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)]
+    return {
+        'starts': starts,
+        'first_day': days[starts],
+        'last_day': days[ends - 1],
+        'frequency': ends - starts,
+        'monetary': np.add.reduceat(chunk['TotalPrice'].to_numpy(dtype='float64'), starts),
+    }
+
+# Add a chunk's histogram counts to the running totals, growing them as needed
+def add_counts(total, counts):
+    if len(counts) > len(total):
+        total = np.pad(total, (0, len(counts) - len(total)))
+    total[:len(counts)] += counts
+    return total
+
+# Bin values at the 20/40/60/80% quantiles of a histogram
+def quintile_edges(bin_values, counts):
+    cumulative = np.cumsum(counts)
+    return bin_values[np.searchsorted(cumulative, cumulative[-1] * np.array([0.2, 0.4, 0.6, 0.8]))]
+
+# 1-5 score: one point plus one per quintile edge below the value
+def quintile_score(values, edges):
+    return 1 + np.searchsorted(edges, values, side='left')
+
+# Segment-level RFM summary and retention/revenue curves by months since first purchase, computed from
+# the customer-sorted daily activity chunk by chunk. The score quintiles come from histograms of a first
+# pass, so no per-customer table is ever built and the working memory follows the chunk size.
+@timed_stage('build_customer_segments')
+def build_customer_segments(activity, chunk_rows=segment_chunk_rows, churn_days=churn_window_days):
+    n_segments = len(SEGMENTS)
+    chunks = list(customer_chunks(activity, chunk_rows))
+    snapshot_day = int(activity['Day'].max()) + 1 if chunks else 0
+    last_month = int(period_ordinal([snapshot_day - 1], 'monthly')[0])
+    n_offsets = last_month - int(period_ordinal([activity['Day'].min()], 'monthly')[0]) + 1 if chunks else 0
+    
+    # Pass 1: distributions of recency (days), purchase days and revenue per customer
+    recency_counts = np.zeros(0, dtype='int64')
+    frequency_counts = np.zeros(0, dtype='int64')
+    monetary_counts = np.zeros(len(MONETARY_EDGES) + 1, dtype='int64')
+    for start, stop in chunks:
+        features = customer_features(activity.iloc[start:stop])
+        recency_counts = add_counts(recency_counts, np.bincount(snapshot_day - features['last_day']))
+        frequency_counts = add_counts(frequency_counts, np.bincount(features['frequency']))
+        monetary_counts += np.bincount(np.searchsorted(MONETARY_EDGES, features['monetary']),
+                                       minlength=len(monetary_counts))
+    
+    if chunks:
+        recency_edges = quintile_edges(np.arange(len(recency_counts)), recency_counts)
+        frequency_edges = quintile_edges(np.arange(len(frequency_counts)), frequency_counts)
+        monetary_edges = quintile_edges(np.append(MONETARY_EDGES, np.inf), monetary_counts)
+    
+    # Pass 2: score and segment each customer and add their activity to the segment totals
+    customers = np.zeros(n_segments, dtype='int64')
+    churned = np.zeros(n_segments, dtype='int64')
+    recency_sum, frequency_sum, monetary_sum = np.zeros((3, n_segments))
+    eligible = np.zeros(n_segments * n_offsets, dtype='int64')
+    active = np.zeros(n_segments * n_offsets, dtype='int64')
+    revenue = np.zeros(n_segments * n_offsets)
+    for start, stop in chunks:
+        chunk = activity.iloc[start:stop]
+        features = customer_features(chunk)
+        recency = snapshot_day - features['last_day']
+        recency_score = 6 - quintile_score(recency, recency_edges)
+        fm_score = (quintile_score(features['frequency'], frequency_edges)
+                    + quintile_score(features['monetary'], monetary_edges) + 1) // 2
+        segment = SEGMENT_GRID[recency_score - 1, fm_score - 1]
+        
+        customers += np.bincount(segment, minlength=n_segments)
+        churned += np.bincount(segment[recency > churn_days], minlength=n_segments)
+        recency_sum += np.bincount(segment, weights=recency, minlength=n_segments)
+        frequency_sum += np.bincount(segment, weights=features['frequency'], minlength=n_segments)
+        monetary_sum += np.bincount(segment, weights=features['monetary'], minlength=n_segments)
+        
+        # Months since first purchase of every row; a customer's rows are contiguous and in day order
+        first_month = period_ordinal(features['first_day'], 'monthly')
+        row_offset = period_ordinal(chunk['Day'], 'monthly') - np.repeat(first_month, features['frequency'])
+        cells = np.repeat(segment, features['frequency']) * n_offsets + row_offset
+        revenue += np.bincount(cells, weights=chunk['TotalPrice'].to_numpy(dtype='float64'), minlength=len(revenue))
+        
+        # A customer counts once per month: keep the first row of each (customer, month) run
+        first_in_month = np.r_[True, row_offset[1:] != row_offset[:-1]]
+        first_in_month[features['starts']] = True
+        active += np.bincount(cells[first_in_month], minlength=len(active))
+        
+        # Customers can only be observed up to the last month of the data
+        eligible += np.bincount(segment * n_offsets + (last_month - first_month), minlength=len(eligible))
+    
+    # Customers observable up to month k are eligible for every month up to k
+    eligible = eligible.reshape(n_segments, n_offsets)[:, ::-1].cumsum(axis=1)[:, ::-1]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary = pd.DataFrame({
+            'Segment': SEGMENTS,
+            'Customers': customers,
+            'AvgRecencyDays': recency_sum / customers,
+            'AvgPurchaseDays': frequency_sum / customers,
+            'AvgRevenue': monetary_sum / customers,
+            'ChurnRate': churned / customers,
+        })
+    
+    segment_idx, offset_idx = np.nonzero(eligible)
+    curves = pd.DataFrame({
+        'Segment': np.array(SEGMENTS, dtype=object)[segment_idx],
+        'MonthsSinceFirstPurchase': offset_idx,
+        'EligibleCustomers': eligible[segment_idx, offset_idx],
+        'ActiveCustomers': active.reshape(n_segments, n_offsets)[segment_idx, offset_idx],
+        'Revenue': revenue.reshape(n_segments, n_offsets)[segment_idx, offset_idx],
+    })
+    curves['RetentionRate'] = curves['ActiveCustomers'] / curves['EligibleCustomers']
+    curves['RevenuePerCustomer'] = curves['Revenue'] / curves['EligibleCustomers']
+    curves['CumulativeRevenuePerCustomer'] = curves.groupby('Segment', sort=False)['RevenuePerCustomer'].cumsum()
+    
+    return summary, curves
+
+# Expected revenue per customer over the first horizon months of each segment (life-table estimate:
+# the average revenue per eligible customer of every month since first purchase, added up)
+def project_segment_clv(curves, horizon=clv_horizon_months):
+    within = curves[curves['MonthsSinceFirstPurchase'] < horizon]
+    return within.groupby('Segment', sort=False)['RevenuePerCustomer'].sum()
+
+# Projected CLV per cohort over the horizon: each cohort's observed revenue per customer, completed for
+# the months it has not reached yet with the size-weighted average of the cohorts that have
+@timed_stage('project_cohort_clv')
+def project_cohort_clv(matrices, horizon=clv_horizon_months):
+    cohort_ordinals = parse_period_labels(matrices['cohorts'], matrices.get('granularity', 'monthly'))
+    sizes = np.asarray(matrices['cohort_size'], dtype='float64')
+    revenue = np.zeros((len(sizes), horizon))
+    n_columns = min(horizon, matrices['revenue'].shape[1])
+    revenue[:, :n_columns] = matrices['revenue'][:, :n_columns]
+    
+    # Last offset each cohort could have reached: the data ends at the latest active period
+    active_cohort, active_offset = np.nonzero(matrices['active'])
+    last_period = (cohort_ordinals[active_cohort] + active_offset).max() if len(active_cohort) else 0
+    reached = np.arange(horizon)[None, :] <= (last_period - cohort_ordinals)[:, None]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_customer = revenue / sizes[:, None]
+        average = np.nan_to_num((revenue * reached).sum(axis=0) / (sizes[:, None] * reached).sum(axis=0))
+    observed = np.where(reached, per_customer, 0.0).sum(axis=1)
+    projected = np.where(reached, 0.0, average[None, :]).sum(axis=1)
+    
+    return pd.DataFrame({
+        'CohortMonth': matrices['cohorts'],
+        'TotalCustomers': sizes,
+        'ObservedRevenuePerCustomer': observed,
+        'ProjectedRevenuePerCustomer': projected,
+        'ProjectedCLV': observed + projected,
+    })
+
+## Figure cache
+# Built figures keyed by the figure function and a fingerprint of its inputs, least recently used first
+figure_cache = OrderedDict()
+_figure_cache_lock = threading.Lock()
+
+# Content hash of the matrices, frames, arrays and labels a figure is built from
+def data_fingerprint(*values):
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        if isinstance(value, dict):
+            for key in sorted(value):
+                digest.update(f"{key}={data_fingerprint(value[key])};".encode())
+        elif isinstance(value, pd.DataFrame):
+            digest.update(repr(list(value.columns)).encode())
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        elif isinstance(value, np.ndarray) and value.dtype != object:
+            digest.update(f"{value.dtype}{value.shape}".encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(value if not isinstance(value, np.ndarray) else value.tolist()).encode())
+    return digest.hexdigest()
+
+# Reuse the figure already built from identical inputs instead of rebuilding it on every layout or filter
+def cached_figure(func):
+    @functools.wraps(func)
+    def wrapper(*args):
+        key = (func.__name__, data_fingerprint(*args))
+        with _figure_cache_lock:
+            if key in figure_cache:
+                figure_cache.move_to_end(key)
+                return figure_cache[key]
+        fig = func(*args)
+        with _figure_cache_lock:
+            figure_cache[key] = fig
+            while len(figure_cache) > figure_cache_size:
+                figure_cache.popitem(last=False)
+        return fig
+    return wrapper
+
+# Divide a cohort matrix by the cohort sizes; cells without active customers stay empty
+def per_customer_matrix(matrices, values):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = values / matrices['cohort_size'][:, None]
+    return np.where(matrices['active'] > 0, result, np.nan)
+
+# Sums over blocks of step x step cells (the last blocks may be partial)
+def block_sum(values, step):
+    n_rows, n_cols = values.shape
+    padded = np.zeros((-(-n_rows // step) * step, -(-n_cols // step) * step))
+    padded[:n_rows, :n_cols] = values
+    return padded.reshape(padded.shape[0] // step, step, padded.shape[1] // step, step).sum(axis=(1, 3))
+
+# Heatmap cells of a per-customer measure as float32 with their cohort and offset labels. Above
+# max_cells, neighbouring cohorts and offsets are merged into square blocks whose value is the
+# customer-weighted average of the block's non-empty cells; labels are each block's first cohort/offset.
+def heatmap_cells(matrices, values, max_cells=heatmap_max_cells):
+    n_rows, n_cols = matrices['active'].shape
+    step = 1
+    while -(-n_rows // step) * -(-n_cols // step) > max_cells:
+        step += 1
+    if step == 1:
+        return per_customer_matrix(matrices, values).astype('float32'), matrices['cohorts'], matrices['offsets'], step
+    
+    observed = matrices['active'] > 0
+    weights = block_sum(np.where(observed, matrices['cohort_size'][:, None], 0), step)
+    totals = block_sum(np.where(observed, values, 0), step)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cells = np.where(weights > 0, totals / weights, np.nan)
+    return cells.astype('float32'), matrices['cohorts'][::step], matrices['offsets'][::step], step
+
+# Title suffix of a downsampled heatmap
+def block_note(step, unit):
+    return '' if step == 1 else f' ({step} x {step} {unit.lower()}s per cell)'
+
+# Axis unit of a granularity ('Month' for matrices without one)
+def granularity_unit(matrices):
+    return GRANULARITY_UNITS[matrices.get('granularity', 'monthly')]
+
+# Hover text of the heatmaps, with the sketch's error bound for approximate ones
+def add_error_hover(fig, matrices, value_label, value_format):
+    unit = granularity_unit(matrices)
+    hovertemplate = (f"Cohort {unit}: %{{y}}<br>{unit}s Since First Purchase: %{{x}}<br>"
+                     + value_label + ": %{z:" + value_format + "}")
+    if 'relative_error' in matrices:
+        hovertemplate += f"<br>Approximate (±{matrices['relative_error']:.1%} std. error)"
+    fig.update_traces(hovertemplate=hovertemplate + "<extra></extra>")
+    return fig
 
 ## Create cohort visualization functions
-def create_retention_heatmap(retention):
-    retention_pivot = retention.pivot_table(index='CohortMonth', 
-                                         columns='CohortIndex', 
-                                         values='RetentionRate')
+# Offsets are sent as a numeric axis (a typed array in the JSON) rather than one "Month i" string per column
+@timed_stage('create_retention_heatmap')
+@cached_figure
+def create_retention_heatmap(matrices):
+    retention_matrix, cohorts, offsets, step = heatmap_cells(matrices, matrices['active'])
+    unit = granularity_unit(matrices)
     
     fig = px.imshow(
-        retention_pivot,
-        labels=dict(x="Months Since First Purchase", 
-                   y="Cohort Month", 
+        retention_matrix,
+        labels=dict(x=f"{unit}s Since First Purchase", 
+                   y=f"Cohort {unit}", 
                    color="Retention Rate"),
-        x=[f"Month {i}" for i in retention_pivot.columns],
-        y=retention_pivot.index,
+        x=offsets,
+        y=cohorts,
         color_continuous_scale='Blues',
         zmin=0,
         zmax=1,
@@ -84,50 +1017,54 @@ def create_retention_heatmap(retention):
     )
     
     fig.update_layout(
-        title='Customer Retention by Cohort',
-        xaxis_title='Months Since First Purchase',
-        yaxis_title='Cohort Month',
+        title='Customer Retention by Cohort' + block_note(step, unit),
+        xaxis_title=f'{unit}s Since First Purchase',
+        yaxis_title=f'Cohort {unit}',
         height=600
     )
     
-    return fig
+    return add_error_hover(fig, matrices, "Retention Rate", ".1%")
 
-def create_revenue_heatmap(revenue):
-    revenue_pivot = revenue.pivot_table(index='CohortMonth', 
-                                      columns='CohortIndex', 
-                                      values='AvgRevenuePerCustomer')
+@timed_stage('create_revenue_heatmap')
+@cached_figure
+def create_revenue_heatmap(matrices):
+    revenue_matrix, cohorts, offsets, step = heatmap_cells(matrices, matrices['revenue'])
+    unit = granularity_unit(matrices)
     
     fig = px.imshow(
-        revenue_pivot,
-        labels=dict(x="Months Since First Purchase", 
-                   y="Cohort Month", 
+        revenue_matrix,
+        labels=dict(x=f"{unit}s Since First Purchase", 
+                   y=f"Cohort {unit}", 
                    color="Avg Revenue per Customer"),
-        x=[f"Month {i}" for i in revenue_pivot.columns],
-        y=revenue_pivot.index,
+        x=offsets,
+        y=cohorts,
         color_continuous_scale='Greens',
         aspect="auto"
     )
     
     fig.update_layout(
-        title='Average Revenue per Customer by Cohort',
-        xaxis_title='Months Since First Purchase',
-        yaxis_title='Cohort Month',
+        title='Average Revenue per Customer by Cohort' + block_note(step, unit),
+        xaxis_title=f'{unit}s Since First Purchase',
+        yaxis_title=f'Cohort {unit}',
         height=600
     )
     
-    return fig
+    return add_error_hover(fig, matrices, "Avg Revenue per Customer", ",.2f")
 
-def create_cohort_size_chart(cohort_size):
+@timed_stage('create_cohort_size_chart')
+@cached_figure
+def create_cohort_size_chart(cohort_size, granularity='monthly'):
+    unit = GRANULARITY_UNITS[granularity]
     fig = px.bar(
         cohort_size,
         x='CohortMonth',
         y='TotalCustomers',
-        labels={'CohortMonth': 'Cohort Month', 'TotalCustomers': 'Number of Customers'},
-        title='New Customer Acquisition by Month'
+        labels={'CohortMonth': f'Cohort {unit}', 'TotalCustomers': 'Number of Customers'},
+        title=f'New Customer Acquisition by {unit}'
     )
     
     fig.update_layout(
-        xaxis_title='Cohort Month',
+        xaxis_title=f'Cohort {unit}',
         yaxis_title='Number of New Customers',
         height=400
     )
@@ -153,41 +1090,397 @@ def create_analysis_insights():
         className="mb-4"
     )
 
-## Update the dashboard layout with cohort analysis tabs
-app.layout = dbc.Container([
-    html.H1("Retail Analytics Dashboard", className="mb-4 text-center"),
-    
-    dbc.Tabs([
-        dbc.Tab(label="Cohort Analysis", children=[
+## Customer segment views
+# Segment table with the projected lifetime value over the configured horizon
+def create_segment_table(summary, curves):
+    table = summary.assign(ProjectedCLV=summary['Segment'].map(project_segment_clv(curves)))
+    table = table[table['Customers'] > 0]
+    columns = [
+        ('Segment', 'Segment', None),
+        ('Customers', 'Customers', ',d'),
+        ('AvgRecencyDays', 'Avg Days Since Last Purchase', ',.0f'),
+        ('AvgPurchaseDays', 'Avg Purchase Days', ',.1f'),
+        ('AvgRevenue', 'Avg Revenue', ',.2f'),
+        ('ChurnRate', f'Churned (> {churn_window_days} days)', '.1%'),
+        ('ProjectedCLV', f'Projected {clv_horizon_months}-Month CLV', ',.2f'),
+    ]
+    return dash_table.DataTable(
+        columns=[{"name": name, "id": column, "type": "numeric" if fmt else "text",
+                  "format": {"specifier": fmt} if fmt else None} for column, name, fmt in columns],
+        data=table.to_dict('records'),
+        sort_action="native",
+        style_table={'overflowX': 'auto'},
+        style_cell={'textAlign': 'left', 'padding': '5px'}
+    )
+
+# Line chart of a curve measure by months since first purchase, one line per segment
+@timed_stage('create_segment_curve_chart')
+@cached_figure
+def create_segment_curve_chart(curves, value, title, value_label):
+    fig = px.line(
+        curves,
+        x='MonthsSinceFirstPurchase',
+        y=value,
+        color='Segment',
+        category_orders={'Segment': SEGMENTS},
+        markers=True,
+        title=title,
+        labels={'MonthsSinceFirstPurchase': 'Months Since First Purchase', value: value_label}
+    )
+    fig.update_layout(height=500)
+    return fig
+
+# Observed plus projected revenue per customer of each monthly cohort over the CLV horizon
+@timed_stage('create_cohort_clv_chart')
+@cached_figure
+def create_cohort_clv_chart(clv):
+    fig = px.bar(
+        clv,
+        x='CohortMonth',
+        y=['ObservedRevenuePerCustomer', 'ProjectedRevenuePerCustomer'],
+        title=f'Projected {clv_horizon_months}-Month Customer Lifetime Value by Cohort',
+        labels={'CohortMonth': 'Cohort Month', 'value': 'Revenue per Customer', 'variable': ''}
+    )
+    fig.for_each_trace(lambda trace: trace.update(name=trace.name.replace('RevenuePerCustomer', '')))
+    fig.update_layout(height=500, barmode='stack')
+    return fig
+
+# Contents of the segments tab
+def build_segment_views():
+    views = []
+    if segment_summary is None:
+        views.append(dbc.Alert("Customer segments need the transaction history and are not available "
+                               "with the incremental cohort state.", color="info"))
+    else:
+        views += [
             dbc.Row([
                 dbc.Col([
-                    html.H3("Customer Acquisition Over Time"),
-                    dcc.Graph(figure=create_cohort_size_chart(cohort_size))
+                    html.H3("Customer Segments (RFM)"),
+                    create_segment_table(segment_summary, segment_curves)
                 ], width=12)
             ], className="mb-4"),
             
             dbc.Row([
                 dbc.Col([
-                    html.H3("Customer Retention Analysis"),
-                    dcc.Graph(figure=create_retention_heatmap(retention))
+                    dcc.Graph(figure=create_segment_curve_chart(
+                        segment_curves, 'RetentionRate', 'Retention by Segment', 'Retention Rate'))
                 ], width=12)
             ], className="mb-4"),
             
             dbc.Row([
                 dbc.Col([
-                    html.H3("Revenue Analysis"),
-                    dcc.Graph(figure=create_revenue_heatmap(revenue))
+                    dcc.Graph(figure=create_segment_curve_chart(
+                        segment_curves, 'CumulativeRevenuePerCustomer', 'Cumulative Revenue per Customer by Segment',
+                        'Cumulative Revenue per Customer'))
                 ], width=12)
             ], className="mb-4"),
+        ]
+    
+    views.append(dbc.Row([
+        dbc.Col([
+            dcc.Graph(figure=create_cohort_clv_chart(cohort_clv))
+        ], width=12)
+    ], className="mb-4"))
+    return views
+
+# Granularities the current mode can serve; the incremental state is kept per month
+def available_granularities():
+    if cohort_state_path:
+        return ['monthly']
+    return list(COHORT_GRANULARITIES)
+
+# Configured granularity, or monthly when the current mode cannot serve it
+def default_granularity():
+    return cohort_granularity if cohort_granularity in available_granularities() else 'monthly'
+
+# Cohort matrices per granularity (serially, in parallel or as sketches) and the customer segment
+# tables from the full transaction history
+def build_matrices_from_transactions(csv_file_path, granularities):
+    transactions = load_transactions(csv_file_path, columns=COHORT_COLUMNS)
+    if resolve_workers(parallel_workers) > 1:
+        matrices = build_cohort_matrices_parallel(transactions, parallel_workers, retention_error_bound, granularities)
+        activity = build_daily_activity(transactions)
+    else:
+        activity = build_daily_activity(transactions)
+        matrices = cohort_matrices_from_activity(activity, granularities, retention_error_bound)
+    del transactions
+    return matrices, build_customer_segments(activity)
+
+# Cube paths of the segment summary and curves; the summary depends on the churn window
+def segment_cube_paths(csv_file_path):
+    return (cube_file_path(csv_file_path, f"segment_summary_churn{churn_window_days}"),
+            cube_file_path(csv_file_path, 'segment_curves'))
+
+# Figures for a view of the cohort matrices
+def build_cohort_figures(matrices):
+    return {
+        'cohort_size': create_cohort_size_chart(cohort_metrics_from_matrices(matrices)[0],
+                                                matrices.get('granularity', 'monthly')),
+        'retention': create_retention_heatmap(matrices),
+        'revenue': create_revenue_heatmap(matrices),
+    }
+
+# Full-range figures per granularity, built the first time a granularity is shown
+cohort_figures = {}
+
+def get_cohort_figures(granularity):
+    if granularity not in cohort_figures:
+        cohort_figures[granularity] = build_cohort_figures(granular_matrices[granularity])
+    return cohort_figures[granularity]
+
+# Cohort matrices for every granularity, customer segments and cohort CLV from the persisted state, the
+# pre-aggregated cubes or one pass over the full history. Only the aggregates are kept; the
+# transactions are released once aggregated.
+def compute_cohort_results(csv_file_path):
+    granularities = available_granularities()
+    if cohort_state_path:
+        # The incremental state keeps no per-customer activity, so there are no segments
+        matrices = {'monthly': refresh_cohort_state(cohort_state_path, incremental_csv_paths)}
+        segments = (None, None)
+    elif use_cohort_cube:
+        cube_paths = {granularity: cohort_cube_path(csv_file_path, retention_error_bound, granularity)
+                      for granularity in granularities}
+        segment_paths = segment_cube_paths(csv_file_path)
+        if all(os.path.exists(path) for path in [*cube_paths.values(), *segment_paths]):
+            matrices = {granularity: cohort_matrices_from_cube(load_cohort_cube(path))
+                        for granularity, path in cube_paths.items()}
+            segments = tuple(load_cohort_cube(path) for path in segment_paths)
+        else:
+            matrices, segments = build_matrices_from_transactions(csv_file_path, granularities)
+            for granularity, path in cube_paths.items():
+                save_cohort_cube(cohort_cube_from_matrices(matrices[granularity]), path)
+            for table, path in zip(segments, segment_paths):
+                save_cohort_cube(table, path)
+    else:
+        matrices, segments = build_matrices_from_transactions(csv_file_path, granularities)
+    return {'matrices': matrices, 'segments': segments, 'cohort_clv': project_cohort_clv(matrices['monthly'])}
+
+# Name of the stored result set; it depends on the counting mode, the granularities it holds (by
+# initial) and the segment settings
+def cohort_store_name():
+    mode = f"hll{hll_precision(retention_error_bound)}" if retention_error_bound else 'exact'
+    granularities = ''.join(granularity[0] for granularity in available_granularities())
+    return f"cohort_{mode}_{granularities}_churn{churn_window_days}_clv{clv_horizon_months}"
+
+# Load the cohort results (mapped from the result store when enabled) and build the figures of the
+# default granularity
+@timed_stage('load_data')
+def load_data(csv_file_path):
+    global granular_matrices, cohort_matrices, cohort_size, retention, revenue, dashboard_figures
+    global segment_summary, segment_curves, cohort_clv
+    if use_result_store and not cohort_state_path:
+        results = load_or_compute_results(result_store_path(csv_file_path, cohort_store_name()),
+                                          lambda: compute_cohort_results(csv_file_path))
+    else:
+        results = compute_cohort_results(csv_file_path)
+    
+    segment_summary, segment_curves = results['segments']
+    cohort_clv = results['cohort_clv']
+    granular_matrices = results['matrices']
+    cohort_figures.clear()
+    cohort_matrices = granular_matrices[default_granularity()]
+    cohort_size, retention, revenue = cohort_metrics_from_matrices(cohort_matrices)
+    dashboard_figures = get_cohort_figures(default_granularity())
+
+# Slider marks for at most max_marks evenly spaced labels
+def slider_marks(labels, max_marks=12):
+    step = max(1, -(-len(labels) // max_marks))
+    return {i: str(labels[i]) for i in range(0, len(labels), step)}
+
+# Cohort range and maximum offset filters over the matrices of one granularity
+def create_cohort_filters(matrices):
+    cohorts = matrices['cohorts']
+    unit = granularity_unit(matrices)
+    last_cohort = max(len(cohorts) - 1, 0)
+    last_offset = max(len(matrices['offsets']) - 1, 0)
+    
+    return dbc.Row([
+        dbc.Col([
+            html.Label(f"Cohort {unit}s"),
+            dcc.RangeSlider(
+                id='cohort-range-filter',
+                min=0,
+                max=last_cohort,
+                step=1,
+                value=[0, last_cohort],
+                marks=slider_marks(cohorts),
+                allowCross=False
+            )
+        ], md=8),
+        
+        dbc.Col([
+            html.Label(f"Max {unit}s Since First Purchase"),
+            dcc.Slider(
+                id='max-offset-filter',
+                min=0,
+                max=last_offset,
+                step=1,
+                value=last_offset,
+                marks=slider_marks(matrices['offsets'])
+            )
+        ], md=4),
+    ], className="mb-4")
+
+# Filters and charts of one granularity
+def build_cohort_views(granularity):
+    figures = get_cohort_figures(granularity)
+    return [
+        create_cohort_filters(granular_matrices[granularity]),
+        
+        dbc.Row([
+            dbc.Col([
+                html.H3("Customer Acquisition Over Time"),
+                dcc.Graph(id='cohort-size-graph', figure=figures['cohort_size'])
+            ], width=12)
+        ], className="mb-4"),
+        
+        dbc.Row([
+            dbc.Col([
+                html.H3("Customer Retention Analysis"),
+                dcc.Graph(id='retention-heatmap', figure=figures['retention'])
+            ], width=12)
+        ], className="mb-4"),
+        
+        dbc.Row([
+            dbc.Col([
+                html.H3("Revenue Analysis"),
+                dcc.Graph(id='revenue-heatmap', figure=figures['revenue'])
+            ], width=12)
+        ], className="mb-4"),
+    ]
+
+## Update the dashboard layout with cohort analysis tabs
+@timed_stage('build_dashboard_content')
+def build_dashboard_content():
+    return [
+        dbc.Tabs([
+            dbc.Tab(label="Cohort Analysis", children=[
+                dbc.Row([
+                    dbc.Col([
+                        html.Label("Cohort Granularity"),
+                        dbc.RadioItems(
+                            id='cohort-granularity',
+                            options=[{'label': granularity.capitalize(), 'value': granularity}
+                                     for granularity in available_granularities()],
+                            value=default_granularity(),
+                            inline=True
+                        )
+                    ], width=12)
+                ], className="mb-4"),
+                
+                html.Div(build_cohort_views(default_granularity()), id='cohort-views'),
+                
+                dbc.Row([
+                    dbc.Col([
+                        create_analysis_insights()
+                    ], width=12)
+                ])
+            ]),
             
-            dbc.Row([
-                dbc.Col([
-                    create_analysis_insights()
-                ], width=12)
-            ])
+            dbc.Tab(label="Customer Segments", children=build_segment_views())
         ])
-    ])
-], fluid=True)
+    ]
+
+# Placeholder shown while the data is loading (or if loading failed)
+def build_loading_content():
+    if data_loader.status == 'failed':
+        return dbc.Alert(f"Loading the data failed: {data_loader.error}", color="danger")
+    return html.Div([
+        dbc.Spinner(color="primary"),
+        html.P("Preparing cohort analysis...", className="mt-2")
+    ], className="text-center my-5")
+
+# Layout is rebuilt per page load; the interval swaps in the dashboard once the data is ready
+def serve_layout():
+    return dbc.Container([
+        html.H1("Retail Analytics Dashboard", className="mb-4 text-center"),
+        html.Div(
+            build_dashboard_content() if data_loader.ready else build_loading_content(),
+            id='dashboard-content'
+        ),
+        dcc.Interval(id='loading-interval', interval=1000, disabled=data_loader.ready),
+        *diagnostics_components()
+    ], fluid=True)
+
+@timed_stage('callback show_dashboard_when_ready')
+def show_dashboard_when_ready(n_intervals):
+    if data_loader.ready:
+        return build_dashboard_content(), True
+    if data_loader.status == 'failed':
+        return build_loading_content(), True
+    return dash.no_update, False
+
+# Swap in the filters and charts of the selected granularity (already aggregated at load time)
+@timed_stage('callback update_cohort_granularity')
+def update_cohort_granularity(granularity):
+    return build_cohort_views(granularity)
+
+# Redraw the charts for the selected cohort range and offsets by slicing the loaded matrices
+@timed_stage('callback update_cohort_figures')
+def update_cohort_figures(cohort_range, max_offset, granularity):
+    matrices = granular_matrices[granularity]
+    cohorts = matrices['cohorts']
+    if not len(cohorts):
+        return dash.no_update, dash.no_update, dash.no_update
+    # Slider positions can briefly belong to the previous granularity while the views are swapped
+    first, last = (min(max(int(position), 0), len(cohorts) - 1) for position in cohort_range)
+    view = slice_cohort_matrices(matrices, cohorts[first], cohorts[last], max_offset)
+    figures = build_cohort_figures(view)
+    return figures['cohort_size'], figures['retention'], figures['revenue']
+
+# App factory: serves a loading page immediately and prepares the data in a background thread
+def create_app(csv_file_path=csv_file_path, preload=True):
+    global data_loader
+    data_loader = BackgroundLoader(lambda: load_data(csv_file_path), 'cohort-dashboard')
+    
+    # Initialize the Dash app
+    app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP],
+                    suppress_callback_exceptions=True, compress=COMPRESS_RESPONSES)
+    app.layout = serve_layout
+    data_loader.attach(app.server)
+    register_diagnostics(app, data_loader)
+    
+    app.callback(
+        [dash.dependencies.Output('dashboard-content', 'children'),
+         dash.dependencies.Output('loading-interval', 'disabled')],
+        [dash.dependencies.Input('loading-interval', 'n_intervals')]
+    )(show_dashboard_when_ready)
+    
+    app.callback(
+        dash.dependencies.Output('cohort-views', 'children'),
+        [dash.dependencies.Input('cohort-granularity', 'value')],
+        prevent_initial_call=True
+    )(update_cohort_granularity)
+    
+    app.callback(
+        [dash.dependencies.Output('cohort-size-graph', 'figure'),
+         dash.dependencies.Output('retention-heatmap', 'figure'),
+         dash.dependencies.Output('revenue-heatmap', 'figure')],
+        [dash.dependencies.Input('cohort-range-filter', 'value'),
+         dash.dependencies.Input('max-offset-filter', 'value')],
+        [dash.dependencies.State('cohort-granularity', 'value')],
+        prevent_initial_call=True
+    )(update_cohort_figures)
+    
+    if preload:
+        data_loader.start()
+    return app
 
 if __name__ == '__main__':
+    # --precompute writes the result store and exits, e.g. before starting several server workers
+    if '--precompute' in sys.argv[1:]:
+        load_data(csv_file_path)
+        sys.exit()
+    
+    # --check-state refreshes the incremental state and compares it with a full recomputation
+    if '--check-state' in sys.argv[1:]:
+        if not cohort_state_path:
+            sys.exit("Set cohort_state_path to check the incremental cohort state")
+        refresh_cohort_state(cohort_state_path, incremental_csv_paths)
+        matches = check_cohort_state(cohort_state_path, incremental_csv_paths)
+        print("Cohort state matches a full recomputation" if matches else "Cohort state differs from a full recomputation")
+        sys.exit(0 if matches else 1)
+    
+    # With debug=True the reloader's parent process only watches files, so only its child preloads
+    app = create_app(csv_file_path, preload=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
     app.run(debug=True)
\ No newline at end of file
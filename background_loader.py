@@ -0,0 +1,56 @@
+import threading
+import time
+
+# Reference point for cold-start timings (taken when the dashboard module is imported)
+PROCESS_START = time.perf_counter()
+
+# Runs a dashboard's data preparation in a background thread so the server can answer right away
+class BackgroundLoader:
+    def __init__(self, load_func, name):
+        self.load_func = load_func
+        self.name = name
+        self.status = 'pending'
+        self.error = None
+        self.loaded_at = None
+        self.timings = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def ready(self):
+        return self.status == 'ready'
+    
+    # Start loading once; later calls are no-ops
+    def start(self):
+        with self._lock:
+            if self.status != 'pending':
+                return
+            self.status = 'loading'
+        threading.Thread(target=self._run, name=f"{self.name}-loader", daemon=True).start()
+    
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            self.load_func()
+            status = 'ready'
+        except Exception as exc:
+            self.error = exc
+            status = 'failed'
+        self.loaded_at = time.time()
+        self.timings['data_load_s'] = time.perf_counter() - started
+        self.timings['data_ready_s'] = time.perf_counter() - PROCESS_START
+        self.status = status
+        print(f"[{self.name}] data {self.status} {self.timings['data_ready_s']:.2f}s after start "
+              f"(load took {self.timings['data_load_s']:.2f}s)" + (f": {self.error!r}" if self.error else ""))
+    
+    # Start loading on the first request and record the time to the first response
+    def attach(self, server):
+        @server.before_request
+        def _start_loading():
+            self.start()
+        
+        @server.after_request
+        def _record_first_response(response):
+            if 'first_response_s' not in self.timings:
+                self.timings['first_response_s'] = time.perf_counter() - PROCESS_START
+                print(f"[{self.name}] first response {self.timings['first_response_s']:.2f}s after start")
+            return response
\ No newline at end of file
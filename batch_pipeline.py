@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from pipeline_modules import load_cohort_module, load_quality_module
+from parallel_backend import map_partitions
+from result_store import result_store_path, save_results
+from transaction_cache import CACHE_FORMAT
+import instrumentation
+
+PIPELINES = ['quality', 'cohort']
+OUTPUT_FORMATS = ['parquet', 'csv', 'json']
+
+# JSON for numpy scalars and timestamps in the metrics
+def json_default(value):
+    return value.item() if hasattr(value, 'item') else str(value)
+
+# Write a frame in each requested format; returns the written paths
+def write_frame(frame, base_path, formats):
+    paths = []
+    for fmt in formats:
+        path = f"{base_path}.{fmt}"
+        if fmt == 'parquet':
+            # Mixed-type object columns (e.g. the issues' field values) are written as text
+            text_columns = [column for column in frame.columns if frame[column].dtype == object]
+            frame.astype({column: 'string' for column in text_columns}).to_parquet(path, index=False)
+        elif fmt == 'csv':
+            frame.to_csv(path, index=False)
+        else:
+            frame.to_json(path, orient='records', date_format='iso', indent=2)
+        paths.append(path)
+    return paths
+
+# Quality checks of one input: metrics and issue frame (and the dashboard's result store)
+def run_quality(csv_path, output_dir, options):
+    quality = load_quality_module()
+    metrics, issue_frame = quality.compute_quality_results(csv_path, options['chunksize'], options['workers'])
+    if options['store']:
+        save_results((metrics, issue_frame),
+                     result_store_path(csv_path, quality.quality_store_name(options['chunksize'])))
+    
+    metrics_path = os.path.join(output_dir, 'quality_metrics.json')
+    with open(metrics_path, 'w') as f:
+        json.dump(metrics, f, indent=2, default=json_default)
+    return [metrics_path] + write_frame(issue_frame, os.path.join(output_dir, 'quality_issues'), options['formats'])
+
+# Cohort tables of one input: one long table per granularity (cells with active customers), the
+# customer segments and the cohort CLV (and the dashboard's result store)
+def run_cohort(csv_path, output_dir, options):
+    cohort = load_cohort_module()
+    cohort.parallel_workers = options['workers']
+    cohort.retention_error_bound = options['error_bound']
+    results = cohort.compute_cohort_results(csv_path)
+    if options['store']:
+        save_results(results, result_store_path(csv_path, cohort.cohort_store_name()))
+    
+    paths = []
+    for granularity, matrices in results['matrices'].items():
+        _, retention, revenue = cohort.cohort_metrics_from_matrices(matrices)
+        table = retention.rename(columns={'CustomerID': 'ActiveCustomers'}).assign(
+            Revenue=revenue['TotalPrice'], AvgRevenuePerCustomer=revenue['AvgRevenuePerCustomer'])
+        paths += write_frame(table, os.path.join(output_dir, f'cohort_{granularity}'), options['formats'])
+    
+    segment_summary, segment_curves = results['segments']
+    if segment_summary is not None:
+        paths += write_frame(segment_summary, os.path.join(output_dir, 'segment_summary'), options['formats'])
+        paths += write_frame(segment_curves, os.path.join(output_dir, 'segment_curves'), options['formats'])
+    paths += write_frame(results['cohort_clv'], os.path.join(output_dir, 'cohort_clv'), options['formats'])
+    return paths
+
+# Run one pipeline on one input into <output_dir>/<input name>/, with its wall time and stage timings.
+# Failures are reported instead of raised so the other jobs still run.
+def run_job(_, csv_path, pipeline, options):
+    output_dir = os.path.join(options['output_dir'], os.path.splitext(os.path.basename(csv_path))[0])
+    os.makedirs(output_dir, exist_ok=True)
+    instrumentation.stage_stats.clear()
+    
+    started = time.perf_counter()
+    try:
+        artifacts = (run_quality if pipeline == 'quality' else run_cohort)(csv_path, output_dir, options)
+        error = None
+    except Exception:
+        artifacts = []
+        error = traceback.format_exc()
+    return {
+        'input': csv_path,
+        'pipeline': pipeline,
+        'seconds': time.perf_counter() - started,
+        'artifacts': artifacts,
+        'error': error,
+        'stages': instrumentation.stage_snapshot(),
+    }
+
+# Per-job summary and the slowest stages of each job
+def print_report(jobs, top_stages):
+    for job in jobs:
+        status = 'FAILED' if job['error'] else f"{len(job['artifacts'])} files"
+        print(f"{job['pipeline']:<8} {job['input']}  {job['seconds']:8.2f} s  {status}")
+        for stage in job['stages'][:top_stages]:
+            rows = '' if stage['rows_out'] is None else f"{stage['rows_out']:>12,} rows"
+            print(f"    {stage['stage']:<36} {stage['duration_s']:9.3f} s {rows}")
+        if job['error']:
+            print(job['error'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Run the quality and cohort pipelines without starting the dashboards and write their results")
+    parser.add_argument('inputs', nargs='+', help="transaction CSV files")
+    parser.add_argument('--output-dir', default='reports', help="artifacts go to <output-dir>/<input name>/")
+    parser.add_argument('--pipelines', nargs='+', choices=PIPELINES, default=PIPELINES)
+    parser.add_argument('--formats', nargs='+', choices=OUTPUT_FORMATS,
+                        default=['parquet' if CACHE_FORMAT == 'parquet' else 'csv'])
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="pipeline/input jobs run at the same time in separate processes")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes within each job")
+    parser.add_argument('--chunksize', type=int, default=None, help="stream the quality checks in chunks of this many rows")
+    parser.add_argument('--error-bound', type=float, default=None,
+                        help="count cohort customers approximately (HyperLogLog) within this relative error")
+    parser.add_argument('--no-store', action='store_true',
+                        help="do not write the result stores the dashboards load on startup")
+    parser.add_argument('--top-stages', type=int, default=5, help="slowest stages listed per job")
+    args = parser.parse_args()
+    
+    options = {
+        'output_dir': args.output_dir,
+        'formats': args.formats,
+        'workers': args.workers,
+        'chunksize': args.chunksize,
+        'error_bound': args.error_bound,
+        'store': not args.no_store,
+    }
+    started = time.perf_counter()
+    jobs = map_partitions(run_job, None, [(csv_path, pipeline, options)
+                                          for csv_path in args.inputs for pipeline in args.pipelines], args.jobs)
+    total_seconds = time.perf_counter() - started
+    
+    print_report(jobs, args.top_stages)
+    os.makedirs(args.output_dir, exist_ok=True)
+    stats_path = os.path.join(args.output_dir, 'batch_stats.json')
+    with open(stats_path, 'w') as f:
+        json.dump({'total_seconds': total_seconds, 'jobs': jobs}, f, indent=2, default=json_default)
+    print(f"Total {total_seconds:.2f} s; timings written to {stats_path}")
+    sys.exit(1 if any(job['error'] for job in jobs) else 0)
\ No newline at end of file
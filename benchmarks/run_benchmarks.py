@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCHMARK_DIR))
+from pipeline_modules import REPO_ROOT, load_cohort_module, load_quality_module
+from synthetic_data import write_transactions_csv
+import transaction_cache
+import result_store
+from instrumentation import frame_bytes
+
+DEFAULT_ROWS = [10 ** 5, 10 ** 6, 10 ** 7]
+DEFAULT_DATA_DIR = os.path.join(BENCHMARK_DIR, 'data')
+DEFAULT_RESULTS_PATH = os.path.join(BENCHMARK_DIR, 'results.jsonl')
+
+# Peak resident memory of the process so far, in MB (None where the resource module is missing)
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+# Run one stage, recording wall time, the peak memory allocated while it ran and the
+# in-memory bytes per row of the frame it returns
+def measure(results, stage, n_rows, func, trace_memory=True):
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - started
+    peak_mb = None
+    if trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    
+    bytes_per_row = None
+    if isinstance(value, pd.DataFrame) and len(value):
+        bytes_per_row = frame_bytes(value) / len(value)
+    
+    results.append({'stage': stage, 'rows': n_rows, 'seconds': round(seconds, 4),
+                    'peak_mb': None if peak_mb is None else round(peak_mb, 2),
+                    'max_rss_mb': max_rss_mb(),
+                    'bytes_per_row': None if bytes_per_row is None else round(bytes_per_row, 1)})
+    peak = '' if peak_mb is None else f"{peak_mb:10.1f} MB"
+    width = '' if bytes_per_row is None else f"{bytes_per_row:8.1f} B/row"
+    print(f"{n_rows:>12,}  {stage:<32} {seconds:9.3f} s {peak} {width}")
+    return value
+
+# Generated input for a size/seed, reused across runs
+def synthetic_csv(n_rows, seed, data_dir):
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"synthetic_{n_rows}_seed{seed}.csv")
+    if not os.path.exists(path):
+        print(f"Generating {n_rows:,} synthetic rows -> {path}")
+        write_transactions_csv(path, n_rows, seed=seed)
+    return path
+
+# Every pipeline stage of both dashboards on one input file
+def run_size(n_rows, seed, data_dir, trace_memory):
+    quality = load_quality_module()
+    cohort = load_cohort_module()
+    path = synthetic_csv(n_rows, seed, data_dir)
+    results = []
+    
+    def stage(name, func):
+        return measure(results, name, n_rows, func, trace_memory)
+    
+    stage('read_csv', lambda: pd.read_csv(path))
+    stage('build_transaction_cache', lambda: transaction_cache.build_transaction_cache(path))
+    df = stage('load_transactions', lambda: transaction_cache.load_transactions(path))
+    
+    stage('evaluate_quality_rules', lambda: quality.evaluate_quality_rules(df))
+    checked = stage('run_data_quality_checks', lambda: quality.run_data_quality_checks(df))
+    stage('calculate_quality_metrics', lambda: quality.calculate_quality_metrics(checked))
+    stage('build_issue_frame', lambda: quality.build_issue_frame(checked))
+    del checked
+    
+    transactions = df[cohort.COHORT_COLUMNS]
+    del df
+    prepared = stage('prepare_cohort_data', lambda: cohort.prepare_cohort_data(transactions))
+    stage('create_cohort_metrics', lambda: cohort.create_cohort_metrics(prepared))
+    matrices = stage('build_cohort_matrices', lambda: cohort.build_cohort_matrices(prepared))
+    cube = stage('cohort_cube_from_matrices', lambda: cohort.cohort_cube_from_matrices(matrices))
+    cube_path = cohort.cohort_cube_path(path)
+    stage('save_cohort_cube', lambda: cohort.save_cohort_cube(cube, cube_path))
+    stage('load_cohort_cube', lambda: cohort.cohort_matrices_from_cube(cohort.load_cohort_cube(cube_path)))
+    activity = stage('build_daily_activity', lambda: cohort.build_daily_activity(transactions))
+    stage('rollup_cohort_data_weekly', lambda: cohort.rollup_cohort_data(activity, 'weekly'))
+    stage('build_granular_cohort_matrices', lambda: cohort.build_granular_cohort_matrices(transactions))
+    stage('build_customer_segments', lambda: cohort.build_customer_segments(activity))
+    stage('project_cohort_clv', lambda: cohort.project_cohort_clv(matrices))
+    stage('create_retention_heatmap', lambda: cohort.create_retention_heatmap(matrices))
+    stage('create_revenue_heatmap', lambda: cohort.create_revenue_heatmap(matrices))
+    daily = cohort.build_granular_cohort_matrices(transactions, ['daily'])['daily']
+    store_path = result_store.result_store_path(path, 'benchmark_daily')
+    stage('save_results', lambda: result_store.save_results(daily, store_path))
+    stage('load_results', lambda: result_store.load_results(store_path))
+    stage('create_retention_heatmap_daily', lambda: cohort.create_retention_heatmap(daily))
+    
+    return results
+
+# Run metadata so results from different commits and machines can be compared
+def run_metadata(seed, trace_memory):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'trace_memory': trace_memory,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the quality and cohort pipelines on synthetic data")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="input sizes to benchmark (e.g. 100000 1000000 10000000 100000000)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="where generated CSVs are kept")
+    parser.add_argument('--output', default=DEFAULT_RESULTS_PATH, help="JSON lines file the results are appended to")
+    parser.add_argument('--no-trace-memory', action='store_true',
+                        help="skip tracemalloc (faster, only process max RSS is recorded)")
+    args = parser.parse_args()
+    
+    trace_memory = not args.no_trace_memory
+    metadata = run_metadata(args.seed, trace_memory)
+    with open(args.output, 'a') as f:
+        for n_rows in args.rows:
+            for result in run_size(n_rows, args.seed, args.data_dir, trace_memory):
+                f.write(json.dumps({**metadata, **result}) + '\n')
+    print(f"Results appended to {args.output}")
\ No newline at end of file
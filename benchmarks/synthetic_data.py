@@ -0,0 +1,120 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+# Same columns (and order) as online_retail_final.csv
+COLUMNS = ['InvoiceNo', 'StockCode', 'Description', 'Quantity', 'InvoiceDate', 'UnitPrice', 'CustomerID', 'TotalPrice']
+
+# Probability that a customer churns in each month since first purchase; the last value repeats
+DEFAULT_CHURN_CURVE = (0.65, 0.3, 0.2, 0.15, 0.1)
+
+# Share of rows broken for each of the six quality checks
+DEFAULT_DIRTY_RATES = {
+    'date': 0.002,
+    'customer_id': 0.05,
+    'quantity': 0.02,
+    'unit_price': 0.005,
+    'description': 0.003,
+    'total_price': 0.001,
+}
+
+PRODUCT_WORDS = np.array(['WHITE', 'RED', 'HANGING', 'HEART', 'T-LIGHT', 'HOLDER', 'VINTAGE', 'CAKE', 'STAND',
+                          'JUMBO', 'BAG', 'LUNCH', 'BOX', 'CERAMIC', 'MUG', 'RETROSPOT', 'GLASS', 'LANTERN'])
+
+# Product catalog: stock codes, descriptions and lognormal unit prices
+def build_catalog(n_products, rng):
+    codes = np.char.add((20000 + np.arange(n_products)).astype(str),
+                        np.where(rng.random(n_products) < 0.2, 'A', ''))
+    words = rng.choice(PRODUCT_WORDS, size=(n_products, 3))
+    descriptions = np.char.add(np.char.add(np.char.add(words[:, 0], ' '), np.char.add(words[:, 1], ' ')), words[:, 2])
+    prices = np.round(rng.lognormal(mean=1.0, sigma=0.8, size=n_products) + 0.01, 2)
+    return codes.astype(object), descriptions.astype(object), prices
+
+# Customers with an acquisition month, a lifetime drawn from the churn curve and a purchase intensity
+def build_customers(n_customers, n_months, churn_curve, rng):
+    acquisition = rng.integers(0, n_months, n_customers)
+    churn = np.array([churn_curve[min(k, len(churn_curve) - 1)] for k in range(n_months)])
+    survived = np.cumprod(rng.random((n_customers, n_months)) >= churn, axis=1)
+    lifetime = np.minimum(survived.sum(axis=1), n_months - 1 - acquisition)
+    weights = rng.lognormal(0.0, 1.0, n_customers)
+    return acquisition, lifetime, weights / weights.sum()
+
+# Yield DataFrame chunks of synthetic transactions; the same seed always gives the same rows
+def iter_transaction_chunks(n_rows, n_customers=None, n_months=12, start_month='2010-12',
+                            churn_curve=DEFAULT_CHURN_CURVE, dirty_rates=None, n_products=4000,
+                            chunk_rows=1000000, seed=0):
+    rng = np.random.default_rng(seed)
+    n_customers = n_customers or max(1, n_rows // 25)
+    dirty_rates = DEFAULT_DIRTY_RATES if dirty_rates is None else dirty_rates
+    codes, descriptions, prices = build_catalog(n_products, rng)
+    acquisition, lifetime, weights = build_customers(n_customers, n_months, churn_curve, rng)
+    first_month = np.datetime64(start_month, 'M')
+    next_invoice = 536365
+    
+    for chunk_start in range(0, n_rows, chunk_rows):
+        n = min(chunk_rows, n_rows - chunk_start)
+        
+        # Each row: a customer (weighted by intensity) buying in one of their active months
+        customer = rng.choice(n_customers, size=n, p=weights)
+        month = first_month + (acquisition[customer] + rng.integers(0, lifetime[customer] + 1)).astype('timedelta64[M]')
+        month_start = month.astype('datetime64[s]')
+        month_seconds = ((month + np.timedelta64(1, 'M')).astype('datetime64[s]') - month_start).astype('int64')
+        dates = month_start + (rng.random(n) * month_seconds).astype('int64').astype('timedelta64[s]')
+        
+        # One invoice per customer and day
+        day = dates.astype('datetime64[D]').astype('int64')
+        invoice_codes, invoice_keys = pd.factorize(customer.astype('int64') * 100000 + day)
+        invoice_no = (next_invoice + invoice_codes).astype(str).astype(object)
+        next_invoice += len(invoice_keys)
+        
+        product = rng.integers(0, len(codes), n)
+        quantity = rng.geometric(0.3, n)
+        unit_price = prices[product]
+        chunk = pd.DataFrame({
+            'InvoiceNo': invoice_no,
+            'StockCode': codes[product],
+            'Description': descriptions[product],
+            'Quantity': quantity,
+            'InvoiceDate': np.datetime_as_string(dates, unit='s').astype(object),
+            'UnitPrice': unit_price,
+            'CustomerID': (12346 + customer).astype('float64'),
+            'TotalPrice': np.round(quantity * unit_price, 2),
+        }, columns=COLUMNS)
+        
+        # Break a share of rows for each quality check
+        def dirty(check):
+            return rng.random(n) < dirty_rates.get(check, 0.0)
+        chunk.loc[dirty('date'), 'InvoiceDate'] = 'not a date'
+        chunk.loc[dirty('customer_id'), 'CustomerID'] = np.nan
+        returns = dirty('quantity')
+        chunk.loc[returns, 'Quantity'] = -chunk.loc[returns, 'Quantity']
+        chunk.loc[returns, 'TotalPrice'] = -chunk.loc[returns, 'TotalPrice']
+        chunk.loc[dirty('unit_price'), 'UnitPrice'] = 0.0
+        chunk.loc[dirty('description'), 'Description'] = np.nan
+        mismatched = dirty('total_price')
+        chunk.loc[mismatched, 'TotalPrice'] += np.round(rng.random(mismatched.sum()) * 10 + 1, 2)
+        
+        yield chunk
+
+# Write the synthetic transactions to a CSV file chunk by chunk
+def write_transactions_csv(path, n_rows, **kwargs):
+    for i, chunk in enumerate(iter_transaction_chunks(n_rows, **kwargs)):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic online-retail transactions")
+    parser.add_argument('output', help="CSV file to write")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--customers', type=int, default=None, help="defaults to rows / 25")
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--churn-curve', type=float, nargs='+', default=list(DEFAULT_CHURN_CURVE),
+                        help="monthly churn probability by months since first purchase")
+    parser.add_argument('--dirty-rate', type=float, default=None,
+                        help="use the same dirty-row rate for all six checks")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    dirty_rates = None if args.dirty_rate is None else {check: args.dirty_rate for check in DEFAULT_DIRTY_RATES}
+    write_transactions_csv(args.output, args.rows, n_customers=args.customers, n_months=args.months,
+                           churn_curve=tuple(args.churn_curve), dirty_rates=dirty_rates, seed=args.seed)
\ No newline at end of file
@@ -0,0 +1,93 @@
+import time
+import flask
+import dash
+from dash import dcc, html, dash_table
+import dash_bootstrap_components as dbc
+from instrumentation import export_json, export_prometheus, frame_memory, record_stage, stage_snapshot
+
+# Components each layout includes; the diagnostics view stays hidden unless the URL has ?diagnostics
+def diagnostics_components():
+    return [
+        dcc.Location(id='url', refresh=False),
+        html.Div(id='diagnostics-panel'),
+        dcc.Interval(id='diagnostics-interval', interval=5000, disabled=True),
+    ]
+
+# Latest stage timings plus the loader's cold-start timings
+def build_diagnostics_panel(loader):
+    rows = [
+        {
+            'stage': stage['stage'],
+            'duration_s': round(stage['duration_s'], 4),
+            'rows_in': stage['rows_in'],
+            'rows_out': stage['rows_out'],
+            'memory_delta_mb': None if stage['memory_delta_mb'] is None else round(stage['memory_delta_mb'], 1),
+            'calls': stage['calls'],
+            'total_s': round(stage['total_s'], 3),
+        }
+        for stage in stage_snapshot()
+    ]
+    startup = ", ".join(f"{name}: {seconds:.2f}s" for name, seconds in loader.timings.items())
+    footprint = ", ".join(f"{name}: {frame['bytes_per_row']:.1f} B/row"
+                          for name, frame in frame_memory.items() if frame['bytes_per_row'] is not None)
+    
+    return dbc.Card(dbc.CardBody([
+        html.H4("Diagnostics: latest stage timings", className="card-title"),
+        html.P(f"Data status: {loader.status}" + (f" ({startup})" if startup else "")),
+        html.P(f"Frame memory: {footprint}") if footprint else None,
+        html.P([
+            "Export: ",
+            html.A("Prometheus", href="/diagnostics/metrics", target="_blank"),
+            " | ",
+            html.A("JSON", href="/diagnostics/stages.json", target="_blank"),
+        ]),
+        dash_table.DataTable(
+            columns=[{"name": name, "id": name} for name in
+                     ['stage', 'duration_s', 'rows_in', 'rows_out', 'memory_delta_mb', 'calls', 'total_s']],
+            data=rows,
+            page_size=25,
+            sort_action="native",
+            style_table={'overflowX': 'auto'},
+            style_cell={'textAlign': 'left', 'padding': '5px'}
+        )
+    ]), className="mb-4")
+
+# Time every Dash request (layout and callbacks, including JSON serialization) and add the export routes
+def register_diagnostics(app, loader):
+    server = app.server
+    
+    @server.before_request
+    def _start_request_timer():
+        flask.g.diagnostics_started = time.perf_counter()
+    
+    @server.after_request
+    def _record_request(response):
+        started = getattr(flask.g, 'diagnostics_started', None)
+        path = flask.request.path
+        if started is not None and path.startswith('/_dash-'):
+            name = f"request {path}"
+            if path.endswith('update-component'):
+                body = flask.request.get_json(silent=True) or {}
+                name = f"request callback {body.get('output', '')}"
+            record_stage(name, time.perf_counter() - started)
+        return response
+    
+    @server.route('/diagnostics/metrics')
+    def _prometheus_metrics():
+        return flask.Response(export_prometheus(), mimetype='text/plain; version=0.0.4')
+    
+    @server.route('/diagnostics/stages.json')
+    def _stages_json():
+        return flask.Response(export_json({'startup': loader.timings, 'status': loader.status}),
+                              mimetype='application/json')
+    
+    @app.callback(
+        [dash.dependencies.Output('diagnostics-panel', 'children'),
+         dash.dependencies.Output('diagnostics-interval', 'disabled')],
+        [dash.dependencies.Input('url', 'search'),
+         dash.dependencies.Input('diagnostics-interval', 'n_intervals')]
+    )
+    def _show_diagnostics(search, n_intervals):
+        if not search or 'diagnostics' not in search:
+            return None, True
+        return build_diagnostics_panel(loader), False
\ No newline at end of file
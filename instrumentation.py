@@ -0,0 +1,147 @@
+import functools
+import json
+import os
+import threading
+import time
+
+# Set RETAIL_INSTRUMENTATION=0 to turn the stage timers into no-ops
+INSTRUMENTATION_ENABLED = os.environ.get('RETAIL_INSTRUMENTATION', '1') != '0'
+
+# Latest record per stage: duration, row counts, memory delta, plus call count and total time
+stage_stats = {}
+_stats_lock = threading.Lock()
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+# Current resident memory of the process in bytes (None where /proc is unavailable)
+def current_rss():
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Row count of a DataFrame, Series or array argument/result (None for anything else)
+def row_count(value):
+    shape = getattr(value, 'shape', None)
+    if shape:
+        return int(shape[0])
+    return None
+
+# Store one run of a stage
+def record_stage(name, duration_s, rows_in=None, rows_out=None, memory_delta=None):
+    with _stats_lock:
+        previous = stage_stats.get(name, {})
+        stage_stats[name] = {
+            'duration_s': duration_s,
+            'rows_in': rows_in,
+            'rows_out': rows_out,
+            'memory_delta_mb': None if memory_delta is None else memory_delta / (1024 * 1024),
+            'calls': previous.get('calls', 0) + 1,
+            'total_s': previous.get('total_s', 0.0) + duration_s,
+            'last_run': time.time(),
+        }
+
+# In-memory size of the frames at each point of the pipeline (e.g. 'csv' as read, 'typed' after compaction)
+frame_memory = {}
+
+# Memory footprint of a DataFrame in bytes, including the string contents of object columns
+def frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+# Record a frame's footprint; bytes per row makes frames of different sizes comparable
+def record_frame_memory(name, df):
+    if not INSTRUMENTATION_ENABLED:
+        return
+    total = frame_bytes(df)
+    with _stats_lock:
+        frame_memory[name] = {
+            'rows': len(df),
+            'bytes': total,
+            'bytes_per_row': total / len(df) if len(df) else None,
+        }
+
+# Times a pipeline stage, as a decorator or a context manager:
+#
+#     @timed_stage('prepare_cohort_data')
+#     def prepare_cohort_data(df): ...
+#
+#     with timed_stage('read_csv') as stage:
+#         df = pd.read_csv(path)
+#         stage.rows_out = len(df)
+class timed_stage:
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = None
+        self.rows_out = None
+    
+    def __enter__(self):
+        self._rss = current_rss() if INSTRUMENTATION_ENABLED else None
+        self._started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if INSTRUMENTATION_ENABLED:
+            duration = time.perf_counter() - self._started
+            rss = current_rss()
+            delta = rss - self._rss if rss is not None and self._rss is not None else None
+            record_stage(self.name, duration, self.rows_in, self.rows_out, delta)
+        return False
+    
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION_ENABLED:
+                return func(*args, **kwargs)
+            with timed_stage(self.name) as stage:
+                stage.rows_in = row_count(args[0]) if args else None
+                result = func(*args, **kwargs)
+                stage.rows_out = row_count(result)
+            return result
+        return wrapper
+
+# Snapshot of the stage records, slowest latest run first
+def stage_snapshot():
+    with _stats_lock:
+        stages = [{'stage': name, **stats} for name, stats in stage_stats.items()]
+    return sorted(stages, key=lambda s: s['duration_s'], reverse=True)
+
+# JSON export of the stage records plus any extra fields (e.g. the loader timings)
+def export_json(extra=None):
+    with _stats_lock:
+        frames = dict(frame_memory)
+    return json.dumps({'stages': stage_snapshot(), 'frame_memory': frames, **(extra or {})}, indent=2, default=str)
+
+# Prometheus text exposition format, one gauge/counter family per measure
+def export_prometheus(prefix='retail_pipeline'):
+    stages = stage_snapshot()
+    families = [
+        ('stage_duration_seconds', 'gauge', 'Duration of the latest run of each stage', 'duration_s'),
+        ('stage_seconds_total', 'counter', 'Total time spent in each stage', 'total_s'),
+        ('stage_calls_total', 'counter', 'Number of runs of each stage', 'calls'),
+        ('stage_rows_in', 'gauge', 'Input rows of the latest run of each stage', 'rows_in'),
+        ('stage_rows_out', 'gauge', 'Output rows of the latest run of each stage', 'rows_out'),
+        ('stage_memory_delta_megabytes', 'gauge', 'Resident memory change during the latest run', 'memory_delta_mb'),
+    ]
+    lines = []
+    for metric, metric_type, help_text, key in families:
+        lines.append(f"# HELP {prefix}_{metric} {help_text}")
+        lines.append(f"# TYPE {prefix}_{metric} {metric_type}")
+        for stage in stages:
+            if stage[key] is not None:
+                label = stage['stage'].replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{prefix}_{metric}{{stage="{label}"}} {stage[key]}')
+    
+    with _stats_lock:
+        frames = dict(frame_memory)
+    lines.append(f"# HELP {prefix}_frame_bytes_per_row In-memory bytes per row of the frame at each pipeline point")
+    lines.append(f"# TYPE {prefix}_frame_bytes_per_row gauge")
+    for name, frame in frames.items():
+        if frame['bytes_per_row'] is not None:
+            lines.append(f'{prefix}_frame_bytes_per_row{{frame="{name}"}} {frame["bytes_per_row"]}')
+    return '\n'.join(lines) + '\n'
\ No newline at end of file
@@ -0,0 +1,44 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Data shared with forked workers; children read it copy-on-write instead of receiving pickled copies
+_shared_data = None
+
+def _run_on_shared(task):
+    func, args = task
+    return func(_shared_data, *args)
+
+# Number of worker processes for a requested count (None or 0 means one per core)
+def resolve_workers(workers):
+    return workers if workers else (os.cpu_count() or 1)
+
+# A forked child gets only the calling thread, so locks held by any other thread (a server thread,
+# a background loader, logging) stay locked in the child forever. Forking is safe only while the
+# calling thread is the process's only thread.
+def fork_is_safe():
+    return 'fork' in multiprocessing.get_all_start_methods() and threading.active_count() == 1
+
+# Run func(data, *args) for every args tuple in a process pool and return the results in order.
+# Workers are forked so the data is inherited rather than serialized; where fork is not
+# available (Windows) or not safe (other threads are running, e.g. inside a dashboard server), or
+# only one worker is requested, the partitions run serially.
+def map_partitions(func, data, partition_args, workers=None):
+    global _shared_data
+    workers = min(resolve_workers(workers), len(partition_args))
+    
+    if workers <= 1 or not fork_is_safe():
+        return [func(data, *args) for args in partition_args]
+    
+    _shared_data = data
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            return list(pool.map(_run_on_shared, [(func, args) for args in partition_args]))
+    finally:
+        _shared_data = None
+
+# Split range(n_rows) into contiguous (start, stop) ranges, one per partition
+def row_ranges(n_rows, n_partitions):
+    bounds = [n_rows * i // n_partitions for i in range(n_partitions + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(n_partitions) if bounds[i] < bounds[i + 1]]
\ No newline at end of file
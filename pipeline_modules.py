@@ -0,0 +1,28 @@
+import importlib.util
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Dashboard scripts live in folders whose names are not valid package names
+DASHBOARD_SCRIPTS = {
+    'quality_dashboard': os.path.join(REPO_ROOT, 'Phase-1  Data Cleaning and Validating', 'Data_Cleaning_n_ Heath_Check.py'),
+    'cohort_dashboard': os.path.join(REPO_ROOT, 'Phase-2 Cohort Analysis', 'cohort_Analysis.py'),
+}
+
+# Import a dashboard script as a module (importing only defines functions; no data is loaded).
+# It is registered in sys.modules so its functions can be pickled for the process pool.
+def load_dashboard_module(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, DASHBOARD_SCRIPTS[name])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def load_quality_module():
+    return load_dashboard_module('quality_dashboard')
+
+def load_cohort_module():
+    return load_dashboard_module('cohort_dashboard')
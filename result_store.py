@@ -0,0 +1,97 @@
+import contextlib
+import mmap
+import os
+import pickle
+import struct
+from transaction_cache import LOCK_SUFFIX, file_lock, source_fingerprint
+from instrumentation import timed_stage
+
+# Result stores are written next to the source CSV in this folder, one per source version and result set
+RESULT_STORE_DIR_NAME = '.result_store'
+
+# File layout: magic, pickle length, buffer count, then the pickle, the (offset, length) table and the
+# out-of-band array buffers, each aligned so it can be mapped straight into numpy/Arrow arrays
+STORE_MAGIC = b'RSTORE01'
+BUFFER_ALIGNMENT = 64
+_HEADER = struct.Struct('<8sQQ')
+_BUFFER_ENTRY = struct.Struct('<QQ')
+
+# Path of a named result set (e.g. 'quality' or 'cohort_exact') of one version of the source file
+def result_store_path(csv_file_path, name):
+    source_dir, source_name = os.path.split(os.path.abspath(csv_file_path))
+    stem = os.path.splitext(source_name)[0]
+    return os.path.join(source_dir, RESULT_STORE_DIR_NAME, f"{stem}-{source_fingerprint(csv_file_path)}-{name}.store")
+
+def _aligned(offset):
+    return -(-offset // BUFFER_ALIGNMENT) * BUFFER_ALIGNMENT
+
+# Write any picklable results (dicts of arrays, DataFrames, scalars) atomically. Array and column data
+# goes out-of-band (pickle protocol 5) so readers can map it instead of copying it.
+@timed_stage('save_results')
+def save_results(results, store_path):
+    store_dir, store_name = os.path.split(store_path)
+    os.makedirs(store_dir, exist_ok=True)
+    
+    buffers = []
+    payload = pickle.dumps(results, protocol=5, buffer_callback=buffers.append)
+    raws = [buffer.raw() for buffer in buffers]
+    
+    offset = _aligned(_HEADER.size + len(payload) + _BUFFER_ENTRY.size * len(raws))
+    table = []
+    for raw in raws:
+        table.append((offset, raw.nbytes))
+        offset = _aligned(offset + raw.nbytes)
+    
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(STORE_MAGIC, len(payload), len(raws)))
+        f.write(payload)
+        for entry in table:
+            f.write(_BUFFER_ENTRY.pack(*entry))
+        for (start, _), raw in zip(table, raws):
+            f.seek(start)
+            f.write(raw)
+    os.replace(tmp_path, store_path)
+    
+    # Names are '<stem>-<fingerprint>-<name>.store'; remove stores of older versions of the same source,
+    # together with their lock files
+    stem, _, name = os.path.splitext(store_name)[0].rsplit('-', 2)
+    for other in os.listdir(store_dir):
+        other_base, other_extension = os.path.splitext(other.removesuffix(LOCK_SUFFIX))
+        if (other_extension == '.store' and other_base.rsplit('-', 2)[::2] == [stem, name]
+                and other.removesuffix(LOCK_SUFFIX) != store_name):
+            # Another process may have removed it first
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(store_dir, other))
+
+# Map a result store read-only. The arrays of the results point into the shared page cache, so every
+# worker process reading the same store holds one copy of the data between them; they are not writable.
+@timed_stage('load_results')
+def load_results(store_path):
+    with open(store_path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    magic, payload_length, n_buffers = _HEADER.unpack_from(view)
+    if magic != STORE_MAGIC:
+        raise ValueError(f"Not a result store: {store_path}")
+    
+    payload_end = _HEADER.size + payload_length
+    buffers = []
+    for i in range(n_buffers):
+        start, length = _BUFFER_ENTRY.unpack_from(view, payload_end + i * _BUFFER_ENTRY.size)
+        buffers.append(view[start:start + length])
+    return pickle.loads(view[_HEADER.size:payload_end], buffers=buffers)
+
+# Exclusive lock around computing a result set, so that of several workers starting together only
+# the first computes and writes the store while the others wait and then map it (without fcntl, on
+# Windows, the first workers may compute the same results concurrently)
+def store_lock(store_path):
+    return file_lock(store_path)
+
+# Results from the store, computing and storing them first if no worker has yet
+def load_or_compute_results(store_path, compute):
+    if not os.path.exists(store_path):
+        with store_lock(store_path):
+            if not os.path.exists(store_path):
+                save_results(compute(), store_path)
+    return load_results(store_path)
\ No newline at end of file
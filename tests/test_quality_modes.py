@@ -0,0 +1,117 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline_modules import load_quality_module
+
+quality = load_quality_module()
+
+COLUMNS = ['InvoiceNo', 'StockCode', 'Description', 'Quantity', 'InvoiceDate', 'UnitPrice', 'CustomerID',
+           'Country', 'TotalPrice']
+
+# Chunk sizes for streaming the small files: single rows, sizes that split duplicates and date formats
+# across chunks, and one chunk for the whole file
+CHUNKSIZES = [1, 2, 3, 7, 100000]
+
+def line(invoice='536365', stock_code='85123A', description='WHITE HEART', quantity=6,
+         date='2010-12-01 08:26:00', price=2.55, customer='17850'):
+    return [invoice, stock_code, description, quantity, date, price, customer, 'United Kingdom',
+            round(quantity * price, 2)]
+
+# Lines that differ only in the text of an invalid date or ID are not duplicates; repeating one is
+def source_text_lines():
+    return [
+        line(date='not a date'),
+        line(date='still not a date'),
+        line(customer='abc'),
+        line(customer='xyz'),
+        line(customer='17851'),
+        line(customer='abc'),
+    ]
+
+# The date format is inferred from the file's first date; later dates in another format are invalid
+# wherever the chunks start
+def mixed_date_lines():
+    lines = [line(invoice=str(536365 + i), date=f'2010-12-{1 + i % 9:02d} 08:26:00') for i in range(10)]
+    lines.insert(7, line(invoice='536380', date='12/01/2010 08:26'))
+    lines.append(line(invoice='536381', date='garbage'))
+    return lines
+
+# A larger file with every kind of issue: repeated lines far apart, price outliers per stock code,
+# invalid dates and IDs, cancellations, missing descriptions and negative quantities
+def mixed_issue_lines(n_rows=240, seed=7):
+    rng = np.random.default_rng(seed)
+    stock_codes = ['85123A', '71053', '84406B', '22752', 'POST', '21730']
+    lines = []
+    for i in range(n_rows):
+        invoice = str(536365 + i // 4)
+        if rng.random() < 0.05:
+            invoice = 'C' + invoice
+        date = f'2011-{1 + i // 40:02d}-{1 + i % 28:02d} 10:{i % 60:02d}:00'
+        if rng.random() < 0.03:
+            date = rng.choice(['not a date', '31/31/2011', ''])
+        customer = str(12346 + int(rng.integers(0, 50)))
+        if rng.random() < 0.05:
+            customer = rng.choice(['', 'abc', 'n/a'])
+        price = round(float(rng.uniform(0.5, 5)), 2)
+        if rng.random() < 0.03:
+            price = price * 40
+        lines.append(line(invoice, stock_codes[int(rng.integers(0, len(stock_codes)))],
+                          rng.choice(['WHITE HEART', 'CANDLE', '']), int(rng.integers(-2, 12)),
+                          date, price, customer))
+    for i in rng.choice(n_rows, 12, replace=False):
+        lines.append(list(lines[i]))
+    return lines
+
+# Crafted files and the chunk sizes they are streamed with
+CASES = {
+    'source_text': (source_text_lines, CHUNKSIZES),
+    'mixed_dates': (mixed_date_lines, CHUNKSIZES),
+    'mixed_issues': (mixed_issue_lines, [13, 64, 100000]),
+}
+
+def write_csv(path, lines):
+    pd.DataFrame(lines, columns=COLUMNS).to_csv(path, index=False)
+    return str(path)
+
+# Issues as comparable rows; streaming keeps a sample per issue type, which holds every issue here
+def issue_rows(issue_frame):
+    rows = issue_frame[['issue_type', 'row_index', 'field_value']].astype(str)
+    return sorted(map(tuple, rows.to_numpy()))
+
+@pytest.mark.parametrize('case', list(CASES))
+def test_serial_parallel_and_streaming_agree(case, tmp_path):
+    lines, chunksizes = CASES[case]
+    csv_path = write_csv(tmp_path / f"{case}.csv", lines())
+    metrics, issues = quality.compute_quality_results(csv_path, None, 1)
+    results = {'workers=2': quality.compute_quality_results(csv_path, None, 2)}
+    for chunksize in chunksizes:
+        results[f'chunksize={chunksize}'] = quality.compute_quality_results(csv_path, chunksize, 1)
+    
+    for mode, (mode_metrics, mode_issues) in results.items():
+        assert mode_metrics == metrics, mode
+        assert issue_rows(mode_issues) == issue_rows(issues), mode
+
+def test_duplicates_compare_source_text(tmp_path):
+    path = write_csv(tmp_path / 'lines.csv', source_text_lines())
+    metrics, _ = quality.compute_quality_results(path, None, 1)
+    assert metrics['duplicate_line_issues'] == 1
+
+def test_dates_parsed_with_first_format(tmp_path):
+    path = write_csv(tmp_path / 'dates.csv', mixed_date_lines())
+    for chunksize in [None, *CHUNKSIZES]:
+        metrics, _ = quality.compute_quality_results(path, chunksize, 1)
+        assert metrics['date_issues'] == 2, chunksize
+
+# Row hashes moved to temporary files once they exceed the memory budget give the same repeats
+def test_streaming_hashes_spilled_to_disk(tmp_path, monkeypatch):
+    path = write_csv(tmp_path / 'issues.csv', mixed_issue_lines())
+    metrics, _ = quality.compute_quality_results(path, None, 1)
+    monkeypatch.setattr(quality, 'STREAMING_HASH_MEMORY', 64)
+    streamed, _ = quality.compute_quality_results(path, 13, 1)
+    assert streamed == metrics
@@ -0,0 +1,189 @@
+import contextlib
+import hashlib
+import os
+import pandas as pd
+from instrumentation import record_frame_memory, timed_stage
+
+# Windows has no fcntl; there processes starting together may build the same cache concurrently
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Parquet needs pyarrow; without it the typed cache is stored as a pickle instead
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+# Cache files are written next to the source CSV in this folder
+CACHE_DIR_NAME = '.transaction_cache'
+
+# Bump when the typed schema changes so caches written by older versions are rebuilt
+CACHE_SCHEMA_VERSION = 3
+
+# Typed schema for the transaction file (columns missing from the CSV are skipped).
+# Invoice numbers repeat on every line of an invoice, so they are stored as categories too.
+CATEGORICAL_COLUMNS = ['InvoiceNo', 'StockCode', 'Description']
+DATETIME_COLUMNS = ['InvoiceDate']
+INTEGER_COLUMNS = ['Quantity']
+ID_COLUMNS = ['CustomerID']
+
+# Prices stay float64: float32 loses cents above ~100k, which breaks the 0.01 total price tolerance
+PRICE_COLUMNS = ['UnitPrice', 'TotalPrice']
+PRICE_DTYPE = 'float64'
+
+# Dates and IDs that cannot be converted become missing values; their original text is kept in a
+# companion column (e.g. 'InvoiceDate_source', categorical and missing elsewhere) so the quality
+# checks can still report what the file contains
+SOURCE_TEXT_COLUMNS = DATETIME_COLUMNS + ID_COLUMNS
+SOURCE_TEXT_SUFFIX = '_source'
+
+# Read the CSV once and convert every known column to its typed representation
+def read_typed_csv(csv_file_path):
+    with timed_stage('read_csv') as stage:
+        df = pd.read_csv(csv_file_path, dtype={col: str for col in CATEGORICAL_COLUMNS})
+        stage.rows_out = len(df)
+    record_frame_memory('csv', df)
+    
+    df = convert_columns(df)
+    
+    record_frame_memory('typed', df)
+    return df
+
+# Format of the first date of each date column that has one, as pandas infers it for a whole column
+# ('mixed', i.e. every value parsed on its own, when it cannot be guessed)
+def guess_date_formats(df):
+    formats = {}
+    for col in DATETIME_COLUMNS:
+        if col in df.columns:
+            first = df[col].dropna().head(1)
+            if len(first) and isinstance(first.iloc[0], str):
+                formats[col] = pd.tseries.api.guess_datetime_format(first.iloc[0]) or 'mixed'
+    return formats
+
+# Convert every known column of a frame read from the CSV to its typed representation. Dates are parsed
+# with the given formats (per column), or with the format pandas infers from the column's first date;
+# chunks of one file pass the formats of the file's first dates so every chunk is parsed the same way.
+def convert_columns(df, date_formats=None):
+    for col in list(df.columns):
+        source = df[col]
+        if col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype('category')
+        elif col in DATETIME_COLUMNS:
+            with timed_stage('to_datetime'):
+                df[col] = pd.to_datetime(df[col], errors='coerce', format=(date_formats or {}).get(col))
+        elif col in INTEGER_COLUMNS:
+            values = pd.to_numeric(df[col], errors='coerce')
+            # Downcast only when every value is a whole number, otherwise keep floats
+            if values.notna().all() and (values % 1 == 0).all():
+                values = pd.to_numeric(values.astype('int64'), downcast='integer')
+            df[col] = values
+        elif col in ID_COLUMNS:
+            values = pd.to_numeric(df[col], errors='coerce')
+            # IDs are read as floats because of missing values; the smallest nullable integer keeps them exact
+            if (values.dropna() % 1 == 0).all():
+                values = pd.to_numeric(values.astype('Int64'), downcast='integer')
+            df[col] = values
+        elif col in PRICE_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(PRICE_DTYPE)
+        
+        if col in SOURCE_TEXT_COLUMNS:
+            df[col + SOURCE_TEXT_SUFFIX] = source.where(df[col].isna()).astype(str).astype('category')
+    
+    return df
+
+# Cache key from the source file's size and modification time (or its full content hash)
+def source_fingerprint(csv_file_path, hash_contents=False):
+    digest = hashlib.sha1()
+    if hash_contents:
+        with open(csv_file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    else:
+        stat = os.stat(csv_file_path)
+        digest.update(f"{stat.st_size}-{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+# Location of the typed cache file for the current version of the source file
+def cache_path_for(csv_file_path, hash_contents=False):
+    source_dir, source_name = os.path.split(os.path.abspath(csv_file_path))
+    stem = os.path.splitext(source_name)[0]
+    extension = 'parquet' if CACHE_FORMAT == 'parquet' else 'pkl'
+    fingerprint = source_fingerprint(csv_file_path, hash_contents)
+    return os.path.join(source_dir, CACHE_DIR_NAME, f"{stem}-{fingerprint}-v{CACHE_SCHEMA_VERSION}.{extension}")
+
+# Convert the CSV into the typed columnar cache, removing caches of older versions
+@timed_stage('build_transaction_cache')
+def build_transaction_cache(csv_file_path, hash_contents=False):
+    cache_path = cache_path_for(csv_file_path, hash_contents)
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    
+    df = read_typed_csv(csv_file_path)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    if CACHE_FORMAT == 'parquet':
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+    
+    # Names are '<stem>-<fingerprint>-v<N>.<ext>'; remove caches of older versions of the same source only,
+    # together with their lock files
+    stem = os.path.splitext(os.path.basename(csv_file_path))[0]
+    for name in os.listdir(cache_dir):
+        stale = os.path.join(cache_dir, name)
+        base, extension = os.path.splitext(name.removesuffix(LOCK_SUFFIX))
+        parts = base.rsplit('-', 2)
+        if (extension in ('.parquet', '.pkl') and len(parts) == 3 and parts[0] == stem
+                and parts[2].startswith('v') and stale.removesuffix(LOCK_SUFFIX) != cache_path):
+            # Another process may have removed it first
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(stale)
+    
+    return cache_path, df
+
+# The frame with the values the cache could not convert restored from their original text (those columns
+# become object dtype); frames read straight from the CSV have no source text and are returned unchanged
+def restore_source_text(df):
+    restored = {}
+    for col in SOURCE_TEXT_COLUMNS:
+        if col in df.columns and col + SOURCE_TEXT_SUFFIX in df.columns:
+            text = df[col + SOURCE_TEXT_SUFFIX].astype(object)
+            restored[col] = df[col].astype(object).where(df[col].notna(), text)
+    return df.assign(**restored) if restored else df
+
+# Exclusive lock around writing a file that several processes may need at the same time (a cache or a
+# result store), so that only the first writes it while the others wait and then read it. The lock is
+# a file next to it (path + LOCK_SUFFIX), removed with the file when a newer version replaces it.
+LOCK_SUFFIX = '.lock'
+
+@contextlib.contextmanager
+def file_lock(path):
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + LOCK_SUFFIX, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Load the transactions from the typed cache (building it on first use), reading only the given columns
+@timed_stage('load_transactions')
+def load_transactions(csv_file_path, columns=None, hash_contents=False):
+    cache_path = cache_path_for(csv_file_path, hash_contents)
+    
+    if not os.path.exists(cache_path):
+        with file_lock(cache_path):
+            if not os.path.exists(cache_path):
+                _, df = build_transaction_cache(csv_file_path, hash_contents)
+                return df[columns] if columns is not None else df
+    
+    if CACHE_FORMAT == 'parquet':
+        return pd.read_parquet(cache_path, columns=columns)
+    df = pd.read_pickle(cache_path)
+    return df[columns] if columns is not None else df